@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""用录制文件离线回放爬取，测量爬虫和转换的吞吐量
+
+先录制一次：
+    python main.py crawl urls.txt --record data/cassettes/bench
+再回放测试（不访问网络，结果可重复）：
+    python bench_crawl.py data/cassettes/bench urls.txt --latency 0.2 --throttle-rate 0.05
+"""
+
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+
+import click
+import yaml
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from crawler import WechatCrawler, read_urls_from_file
+from crawler_improved import WechatCrawlerImproved
+from converter import HtmlToMarkdownConverter
+
+def bench_config(base_config_path, workdir, cassette):
+    """在临时目录中运行，使用回放模式（回放时不使用HTTP缓存）"""
+    with open(base_config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    
+    config['paths'] = {name: str(workdir / name) for name in
+                       ['raw_articles', 'markdown', 'images', 'http_cache', 'themes', 'output']}
+    config['storage'] = dict(config.get('storage') or {}, debug_dumps=False)
+    config['cassette'] = cassette
+    
+    config_path = workdir / "config.yaml"
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return config_path
+
+@click.command()
+@click.argument('cassette_path', type=click.Path(exists=True, file_okay=False))
+@click.argument('urls_file', type=click.Path(exists=True))
+@click.option('--crawler', 'crawler_name', type=click.Choice(['basic', 'improved', 'both']), default='both')
+@click.option('--latency', default=0.0, help='每个请求的模拟延迟（秒）')
+@click.option('--jitter', default=0.0, help='延迟的随机浮动范围（秒）')
+@click.option('--throttle-rate', default=0.0, help='随机返回429的比例')
+@click.option('--rate-limit', is_flag=True, help='回放时仍按配置限速')
+@click.option('--seed', default=0, help='随机数种子')
+@click.option('--config', 'base_config', default=None, help='基础配置文件，默认 config/config.yaml')
+def main(cassette_path, urls_file, crawler_name, latency, jitter, throttle_rate, rate_limit, seed, base_config):
+    root = Path(__file__).parent
+    if base_config is None:
+        base_config = root / "config" / "config.yaml"
+        if not base_config.exists():
+            base_config = root / "config" / "config.example.yaml"
+    
+    cassette = {
+        'mode': 'replay',
+        'path': str(Path(cassette_path).resolve()),
+        'latency': latency,
+        'jitter': jitter,
+        'throttle_rate': throttle_rate,
+        'seed': seed,
+        'respect_rate_limit': rate_limit,
+    }
+    urls = read_urls_from_file(urls_file)
+    
+    crawlers = {'basic': WechatCrawler, 'improved': WechatCrawlerImproved}
+    names = list(crawlers) if crawler_name == 'both' else [crawler_name]
+    
+    report = []
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = Path(tmp)
+            config_path = bench_config(base_config, workdir, cassette)
+            
+            crawler = crawlers[name](str(config_path))
+            start = time.perf_counter()
+            results = asyncio.run(crawler.crawl_articles(urls))
+            crawl_time = time.perf_counter() - start
+            crawler.journal.close()
+            
+            images = sum(len(article.get('images', {})) for article in results)
+            
+            converter = HtmlToMarkdownConverter(str(config_path))
+            start = time.perf_counter()
+            converted = converter.convert_all_articles()
+            convert_time = time.perf_counter() - start
+            
+            report.append((name, len(urls), len(results), images, crawl_time, len(converted), convert_time))
+    
+    print(f"\n{'='*60}")
+    print(f"📊 回放基准（延迟 {latency}s ±{jitter}s，限流比例 {throttle_rate}，"
+          f"{'按配置限速' if rate_limit else '不限速'}）")
+    for name, total, done, images, crawl_time, converted, convert_time in report:
+        print(f"\n🕷  {name}: {done}/{total} 篇，{images} 张图片")
+        print(f"   爬取: {crawl_time:7.2f} s  ({done / crawl_time if crawl_time else 0:.1f} 篇/秒)")
+        print(f"   转换: {convert_time:7.2f} s  ({converted / convert_time if convert_time else 0:.1f} 篇/秒)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""对比HTML转Markdown的耗时：markdownify（序列化后用BeautifulSoup重新解析）
+与 WechatMarkdownRenderer（直接遍历已清理的元素树）
+
+用法: python bench_markdown.py [段落数] [重复次数]
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from converter import HtmlToMarkdownConverter
+from bench_parse import make_article, timed
+
+def main():
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "config.yaml"
+        config_path.write_text(
+            f"paths:\n  raw_articles: {tmp}/raw\n  markdown: {tmp}/markdown\n", encoding='utf-8'
+        )
+        converter = HtmlToMarkdownConverter(str(config_path))
+        
+        for size in [paragraphs // 4, paragraphs, paragraphs * 4]:
+            content = converter.clean_html(make_article(size))
+            
+            old_time, old_markdown = timed(lambda: converter.markdownify(content), repeat)
+            new_time, new_markdown = timed(lambda: converter.wechat_renderer.render(content), repeat)
+            
+            print(f"\n📄 {size} 段")
+            print(f"   markdownify: {old_time * 1000:8.1f} ms  ({len(old_markdown) / 1024:.0f} KB)")
+            print(f"   wechat:      {new_time * 1000:8.1f} ms  ({len(new_markdown) / 1024:.0f} KB)  "
+                  f"({old_time / new_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
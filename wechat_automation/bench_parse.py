@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""对比每篇文章的HTML解析耗时：旧流程（html.parser解析4次）与新流程（lxml解析1次）
+
+用法: python bench_parse.py [段落数] [重复次数]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import tempfile
+from pathlib import Path
+from bs4 import BeautifulSoup
+from markdownify import markdownify as md
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from article_parser import parse_article, to_html
+from converter import HtmlToMarkdownConverter
+
+def make_article(paragraphs=400, seed=0):
+    """生成与微信文章页面结构相似的HTML：大量脚本、样式和嵌套section"""
+    rng = random.Random(seed)
+    words = "数据 模型 增长 用户 产品 运营 内容 平台 分析 策略 市场 技术".split()
+    
+    head = ['<meta property="og:title" content="测试文章标题">']
+    for i in range(30):
+        head.append(f"<script>var data_{i} = {{{', '.join(f'k{j}: {j}' for j in range(200))}}};</script>")
+        head.append(f"<style>.c{i} {{ color: #{i:06x}; margin: {i}px; }}</style>")
+    
+    body = []
+    for i in range(paragraphs):
+        text = ''.join(rng.choice(words) for _ in range(40))
+        body.append(f'<section style="margin: 0 8px;"><p style="line-height: 1.75;">'
+                    f'<span style="color: #333;"><strong>{i}.</strong>{text}</span></p></section>')
+        if i % 10 == 0:
+            body.append(f'<p><img data-src="https://mmbiz.qpic.cn/mmbiz_png/{i}/640?wx_fmt=png" '
+                        f'class="rich_pages" style="width: 100%;"></p>')
+        if i % 50 == 0:
+            body.append('<script>report("view");</script>')
+    
+    return ("<!DOCTYPE html><html><head>" + ''.join(head) + "</head><body>"
+            '<div class="rich_media_area_primary"><h1 class="rich_media_title">测试文章标题</h1>'
+            '<div class="rich_media_content" id="js_content">' + ''.join(body) + "</div></div>"
+            + ''.join(head[1:]) + "</body></html>")
+
+def legacy_pipeline(html_text, markdown_path):
+    """重构前的流程：爬虫、图片下载、clean_html、process_images 各解析一次"""
+    # crawler.parse_content
+    soup = BeautifulSoup(html_text, 'html.parser')
+    content_div = soup.find('div', class_='rich_media_content')
+    content_html = str(content_div)
+    
+    # crawler.download_images
+    soup = BeautifulSoup(content_html, 'html.parser')
+    images = []
+    for img in soup.find_all('img'):
+        for attr in ['data-src', 'src', 'data-original']:
+            if img.get(attr):
+                images.append(img.get(attr))
+                break
+    image_mapping = {url: f"data/images/a/image_{i+1}.png" for i, url in enumerate(images)}
+    
+    # converter.clean_html
+    soup = BeautifulSoup(html_text, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    cleaned_html = str(soup.find('div', class_='rich_media_content'))
+    
+    # converter.process_images
+    soup = BeautifulSoup(cleaned_html, 'html.parser')
+    for img in soup.find_all('img'):
+        img_url = img.get('data-src') or img.get('src')
+        if img_url in image_mapping:
+            img['src'] = os.path.relpath(image_mapping[img_url], markdown_path)
+            if not img.get('alt'):
+                img['alt'] = "图片"
+    
+    # converter.html_to_markdown
+    markdown = md(str(soup), heading_style="ATX", bullets="-", code_language="python",
+                  strip=['script', 'style'])
+    return images, re.sub(r'\n{3,}', '\n\n', markdown)
+
+def new_pipeline(html_text, converter):
+    """新流程：爬虫解析一次得到图片列表，转换器解析一次并直接修改元素树"""
+    parsed = parse_article(html_text, 'basic')
+    content_html = to_html(parsed['content'])
+    images = [url for url in parsed['images'] if url]
+    image_mapping = {url: f"data/images/a/image_{i+1}.png" for i, url in enumerate(images)}
+    
+    content = converter.clean_html(html_text)
+    content = converter.process_images(content, image_mapping)
+    markdown = converter.html_to_markdown(content)
+    return images, markdown, content_html
+
+def legacy_parse_only(html_text):
+    """只计旧流程的解析：整页两次、正文区域两次"""
+    content_html = str(BeautifulSoup(html_text, 'html.parser').find('div', class_='rich_media_content'))
+    BeautifulSoup(content_html, 'html.parser')
+    cleaned_html = str(BeautifulSoup(html_text, 'html.parser').find('div', class_='rich_media_content'))
+    BeautifulSoup(cleaned_html, 'html.parser')
+
+def new_parse_only(html_text):
+    """只计新流程的解析：爬虫和转换器各解析整页一次"""
+    parse_article(html_text, 'basic')
+    parse_article(html_text, 'converter')
+
+def timed(func, repeat):
+    """返回最快一次的耗时（秒）和结果"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "config.yaml"
+        config_path.write_text(
+            f"paths:\n  raw_articles: {tmp}/raw\n  markdown: {tmp}/markdown\n"
+            # 与旧流程比较输出，固定使用markdownify
+            "converter:\n  renderer: markdownify\n", encoding='utf-8'
+        )
+        converter = HtmlToMarkdownConverter(str(config_path))
+        
+        for size in [paragraphs // 4, paragraphs, paragraphs * 4]:
+            html_text = make_article(size)
+            
+            old_time, (old_images, old_markdown) = timed(
+                lambda: legacy_pipeline(html_text, converter.markdown_path), repeat)
+            new_time, (new_images, new_markdown, _) = timed(
+                lambda: new_pipeline(html_text, converter), repeat)
+            
+            old_parse, _ = timed(lambda: legacy_parse_only(html_text), repeat)
+            new_parse, _ = timed(lambda: new_parse_only(html_text), repeat)
+            
+            print(f"\n📄 页面大小: {len(html_text) / 1024:.0f} KB，{size} 段，{len(new_images)} 张图片")
+            print(f"   仅解析   旧 (html.parser x4): {old_parse * 1000:8.1f} ms  "
+                  f"新 (lxml): {new_parse * 1000:8.1f} ms  ({old_parse / new_parse:.1f}x)")
+            print(f"   含转换   旧:                  {old_time * 1000:8.1f} ms  "
+                  f"新:        {new_time * 1000:8.1f} ms  ({old_time / new_time:.1f}x)")
+            print(f"   图片列表一致: {old_images == new_images}，"
+                  f"Markdown一致: {old_markdown.strip() == new_markdown.strip()}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
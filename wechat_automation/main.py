@@ -9,12 +9,14 @@ from pathlib import Path
 import sys
 import json
 import os
+import yaml
 
 # 添加src目录到Python路径
 sys.path.append(str(Path(__file__).parent / "src"))
 
 from crawler import WechatCrawler, read_urls_from_file
 from converter import HtmlToMarkdownConverter
+from dedup import Deduplicator
 from classifier import ArticleClassifier
 from extractor import MaterialExtractor
 from image_tagger import ImageTagger
@@ -29,7 +31,10 @@ def cli():
 @cli.command()
 @click.argument('urls_file', type=click.Path(exists=True), required=False)
 @click.option('--interactive', '-i', is_flag=True, help='交互式输入URL')
-def crawl(urls_file, interactive):
+@click.option('--force', is_flag=True, help='忽略爬取日志，重新爬取已完成的文章')
+@click.option('--record', 'record_path', type=click.Path(file_okay=False), help='把所有页面和图片响应录制到该目录')
+@click.option('--replay', 'replay_path', type=click.Path(exists=True, file_okay=False), help='从录制目录回放，不访问网络')
+def crawl(urls_file, interactive, force, record_path, replay_path):
     """批量爬取公众号文章
     
     URLS_FILE: 包含文章链接的文本文件，每行一个链接（可选）
@@ -59,44 +64,80 @@ def crawl(urls_file, interactive):
         urls = read_urls_from_file(urls_file)
         click.echo(f"找到 {len(urls)} 个链接")
     
+    if record_path and replay_path:
+        click.echo("--record 和 --replay 不能同时使用")
+        return
+    
     # 创建爬虫并运行
     crawler = WechatCrawler()
-    asyncio.run(crawler.crawl_articles(urls))
+    if record_path or replay_path:
+        # 延迟、限流等模拟参数沿用配置文件中的 cassette 设置
+        cassette_config = dict(crawler.config.get('cassette') or {})
+        cassette_config.update(mode='record' if record_path else 'replay', path=record_path or replay_path)
+        crawler.config['cassette'] = cassette_config
+    asyncio.run(crawler.crawl_articles(urls, force=force))
     
     click.echo("爬取完成！")
 
 @cli.command()
-def convert():
-    """将HTML文章转换为Markdown格式"""
+@click.option('--workers', '-w', type=int, default=None, help='并行转换的进程数（默认读取 system.convert_workers）')
+@click.option('--force', is_flag=True, help='忽略转换清单，重新转换所有文章')
+def convert(workers, force):
+    """将HTML文章转换为Markdown格式（只转换有变化的文章）"""
     click.echo("开始转换文章...")
     
     converter = HtmlToMarkdownConverter()
-    converter.convert_all_articles()
+    converter.convert_all_articles(workers=workers, force=force)
     
     click.echo("转换完成！")
 
 @cli.command()
-def classify():
+@click.option('--max-distance', type=int, default=None, help='SimHash汉明距离阈值（默认读取 dedup.max_distance）')
+def dedup(max_distance):
+    """检测近似重复的文章（convert 后会自动运行），重复文章在后续步骤中跳过"""
+    with open("config/config.yaml", 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    
+    dedup_config = dict(config.get('dedup') or {}, enabled=True)
+    if max_distance is not None:
+        dedup_config['max_distance'] = max_distance
+        if (dedup_config.get('bands') or 0) <= max_distance:
+            # 配置的分段数不足以保证不漏检，改为按阈值自动选择
+            dedup_config['bands'] = None
+    config['dedup'] = dedup_config
+    
+    Deduplicator.from_config(config).run()
+
+@cli.command()
+@click.option('--mode', type=click.Choice(['llm', 'cluster']), default=None,
+              help='llm: 模型分批分类；cluster: 本地向量聚类后由模型命名（默认读取 classify.mode）')
+@click.option('--incremental', is_flag=True, help='只把新文章归入已有主题，不重新分类已有文章')
+@click.option('--dry-run', is_flag=True, help='只估算模型调用次数、token数和耗时，不调用模型')
+def classify(mode, incremental, dry_run):
     """对文章进行智能分类"""
     click.echo("开始分类文章...")
     
     classifier = ArticleClassifier()
-    result = classifier.run()
+    result = classifier.run(mode=mode, incremental=incremental, dry_run=dry_run)
     
+    if dry_run:
+        return
     if result:
         click.echo("分类完成！")
     else:
         click.echo("分类失败！")
 
 @cli.command()
-def extract():
+@click.option('--dry-run', is_flag=True, help='只估算模型调用次数、token数和耗时，不调用模型')
+def extract(dry_run):
     """提取文章的12维度素材"""
     click.echo("开始提取素材...")
     
     extractor = MaterialExtractor()
-    extractor.extract_all_themes()
+    extractor.extract_all_themes(dry_run=dry_run)
     
-    click.echo("素材提取完成！")
+    if not dry_run:
+        click.echo("素材提取完成！")
 
 @cli.command()
 def tag_images():
@@ -112,14 +153,18 @@ def tag_images():
 @click.argument('theme_name')
 @click.option('--interactive', '-i', is_flag=True, help='交互式创作模式')
 @click.option('--batch', '-b', type=int, help='批量创作文章数量')
-def create(theme_name, interactive, batch):
+@click.option('--dry-run', is_flag=True, help='只估算模型调用次数、token数和耗时，不调用模型')
+def create(theme_name, interactive, batch, dry_run):
     """基于素材库创作文章
     
     THEME_NAME: 主题名称
     """
     creator = ContentCreator()
     
-    if batch:
+    if dry_run:
+        # 交互模式是否优化由用户决定，按优化估算
+        creator.plan_create(theme_name, count=batch or 1)
+    elif batch:
         # 批量创作模式
         creator.batch_create(theme_name, count=batch)
     elif interactive:
@@ -289,7 +334,7 @@ def process_with_review(urls_file, interactive):
             break
         elif action == 'r':
             click.echo("重新执行爬取...")
-            results = asyncio.run(crawler.crawl_articles(urls))
+            results = asyncio.run(crawler.crawl_articles(urls, force=True))
             
             # 重新显示结果
             if results:
@@ -341,7 +386,7 @@ def process_with_review(urls_file, interactive):
             break
         elif action == 'r':
             click.echo("重新执行转换...")
-            converter.convert_all_articles()
+            converter.convert_all_articles(force=True)
             continue
         elif action == 'v':
             # 列出所有文件让用户选择查看
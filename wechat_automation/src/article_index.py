@@ -0,0 +1,73 @@
+import json
+from pathlib import Path
+
+class ArticleIndex:
+    """只追加的文章索引（index.jsonl）：每篇文章完成时写入一行，读取时按文章ID去重，以最后一条为准
+    
+    读取时只在内存中保留 文章ID -> 文件偏移，逐条解析，文章数很多时也不需要整体加载或重写。
+    旧版的 index.json 仍可读取，其中没有出现在 index.jsonl 的文章排在前面。
+    """
+    
+    def __init__(self, raw_articles_path):
+        raw_articles_path = Path(raw_articles_path)
+        self.path = raw_articles_path / "index.jsonl"
+        self.legacy_path = raw_articles_path / "index.json"
+    
+    def exists(self):
+        return self.path.exists() or self.legacy_path.exists()
+    
+    def append(self, metadata):
+        """写入一篇文章的元数据"""
+        line = json.dumps(metadata, ensure_ascii=False) + "\n"
+        with open(self.path, 'a+b') as f:
+            # 上次中断留下的不完整行单独成行，不影响本条记录
+            if f.tell() > 0:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    line = "\n" + line
+            f.write(line.encode('utf-8'))
+    
+    def offsets(self):
+        """扫描一遍索引，返回 文章ID -> 最后一条记录的偏移，按文章首次出现的顺序"""
+        offsets = {}
+        if not self.path.exists():
+            return offsets
+        
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    article_id = json.loads(line)['id']
+                except (ValueError, KeyError, TypeError):
+                    # 中断时可能留下不完整的最后一行
+                    article_id = None
+                if article_id is not None:
+                    offsets[article_id] = offset
+                offset += len(line)
+        return offsets
+    
+    def legacy_articles(self, skip_ids):
+        """旧版 index.json 中不在 skip_ids 里的文章"""
+        if not self.legacy_path.exists():
+            return []
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            articles = json.load(f)
+        return [article for article in articles if article.get('id') not in skip_ids]
+    
+    def __iter__(self):
+        """逐篇返回去重后的文章元数据"""
+        offsets = self.offsets()
+        
+        for article in self.legacy_articles(offsets):
+            yield article
+        
+        if not offsets:
+            return
+        with open(self.path, 'rb') as f:
+            for offset in offsets.values():
+                f.seek(offset)
+                yield json.loads(f.readline())
+    
+    def __len__(self):
+        offsets = self.offsets()
+        return len(offsets) + len(self.legacy_articles(offsets))
\ No newline at end of file
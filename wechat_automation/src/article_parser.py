@@ -0,0 +1,148 @@
+import re
+from lxml import etree
+from lxml import html as lxml_html
+
+def has_class(tag, class_name):
+    """匹配class中包含某个完整类名的元素"""
+    return f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+# 爬虫和转换器使用的选择器配置，页面只用lxml解析一次
+PROFILES = {
+    # crawler.py
+    'basic': {
+        'titles': [
+            has_class('h1', 'rich_media_title'),
+            has_class('h2', 'rich_media_title'),
+            "//meta[@property='og:title']/@content",
+        ],
+        'title_from_script': False,
+        'content': [
+            has_class('div', 'rich_media_content'),
+            "//div[@id='js_content']",
+            has_class('div', 'rich_media_area_primary'),
+        ],
+        'fallback': 'body',
+        'image_attrs': ['data-src', 'src', 'data-original'],
+    },
+    # crawler_improved.py
+    'improved': {
+        'titles': [
+            "//meta[@property='og:title']/@content",
+            "//h1[contains(@class, 'rich_media_title')]",
+            "//h2[contains(@class, 'rich_media_title')]",
+        ],
+        'title_from_script': True,
+        'content': [
+            has_class('div', 'rich_media_content'),
+            "//div[@id='js_content']",
+            "//div[contains(@class, 'rich_media_area')]",
+            "//div[@id='img-content']",
+            "//article",
+        ],
+        'fallback': 'sections',
+        'image_attrs': ['data-src', 'src', 'data-original', 'data-croporisrc'],
+    },
+    # converter.py
+    'converter': {
+        'titles': [],
+        'title_from_script': False,
+        'content': [
+            has_class('div', 'rich_media_content'),
+        ],
+        'fallback': 'document',
+        'image_attrs': ['data-src', 'src'],
+    },
+}
+
+def parse_document(html_text):
+    """用lxml解析整个页面，返回根元素，空文档返回None"""
+    if not html_text or not html_text.strip():
+        return None
+    try:
+        return lxml_html.document_fromstring(html_text)
+    except ValueError:
+        # 带有XML编码声明的字符串不能直接解析
+        parser = lxml_html.HTMLParser(encoding='utf-8')
+        return lxml_html.document_fromstring(html_text.encode('utf-8'), parser=parser)
+    except etree.ParserError:
+        return None
+
+def element_text(element):
+    """元素的文本，各段去掉首尾空白后拼接"""
+    return ''.join(text.strip() for text in element.itertext())
+
+def to_html(elements):
+    """把正文元素序列化为HTML"""
+    return '\n'.join(lxml_html.tostring(element, encoding='unicode', with_tail=False) for element in elements)
+
+def image_url(img, attrs):
+    """按顺序取第一个非空的图片地址属性"""
+    for attr in attrs:
+        if img.get(attr):
+            return img.get(attr)
+    return None
+
+def find_title(root, profile, html_text):
+    for xpath in profile['titles']:
+        for match in root.xpath(xpath):
+            text = match.strip() if isinstance(match, str) else element_text(match)
+            if text:
+                return text
+    
+    if profile['title_from_script']:
+        # 从JavaScript变量中提取
+        title_match = re.search(r'var\s+msg_title\s*=\s*["\']([^"\']+)["\']', html_text)
+        if title_match:
+            return title_match.group(1).strip()
+    
+    return "未知标题"
+
+def find_content(root, profile):
+    """返回 (正文元素列表, 使用的选择器)，都找不到时按配置的后备方案返回"""
+    for xpath in profile['content']:
+        matches = root.xpath(xpath)
+        if matches:
+            return [matches[0]], xpath
+    
+    fallback = profile['fallback']
+    if fallback == 'body':
+        body = root.find('body')
+        return ([body] if body is not None else []), None
+    if fallback == 'sections':
+        return root.xpath('//section'), None
+    if fallback == 'document':
+        return [root], None
+    return [], None
+
+def parse_article(html_text, profile='basic'):
+    """解析文章页面（只解析一次）
+    
+    返回字典：
+        title: 标题
+        content: 正文元素列表（已移除script/style），可以直接修改
+        selector: 找到正文时使用的选择器，使用后备方案时为None
+        images: 正文中每个img的原始地址，按出现顺序，没有地址的为None
+    页面为空时返回None
+    """
+    profile = PROFILES[profile]
+    root = parse_document(html_text)
+    if root is None:
+        return None
+    
+    title = find_title(root, profile, html_text)
+    content, selector = find_content(root, profile)
+    
+    images = []
+    for element in content:
+        # 移除脚本和样式，保留其后的文本
+        for node in element.xpath('.//script|.//style'):
+            node.drop_tree()
+        for img in element.iter('img'):
+            images.append(image_url(img, profile['image_attrs']))
+    
+    return {
+        'title': title,
+        'content': content,
+        'selector': selector,
+        'images': images,
+    }
\ No newline at end of file
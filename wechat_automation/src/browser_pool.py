@@ -0,0 +1,148 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class BrowserPool:
+    """可复用的无头浏览器池，供Selenium备用方案使用（需要单独安装selenium）
+    
+    浏览器在首次使用时启动，每个浏览器处理 max_pages 个页面或崩溃后重建；等待正文超时不重建。
+    页面在线程池中加载，不会阻塞爬虫的事件循环。
+    """
+    
+    def __init__(self, size=2, max_pages=50, page_timeout=10, user_agent=None):
+        self.size = size
+        self.max_pages = max_pages
+        self.page_timeout = page_timeout
+        self.user_agent = user_agent
+        
+        # 空闲的浏览器，元素为 [driver, 已处理页面数]
+        self.idle = queue.Queue()
+        self.executor = None
+        self.lock = threading.Lock()
+        
+        self.stats = {'started': 0, 'recycled': 0, 'crashed': 0, 'timeouts': 0, 'pages': 0}
+    
+    @classmethod
+    def from_config(cls, config, user_agent=None):
+        """从 selenium 配置创建"""
+        selenium_config = config.get('selenium', {}) or {}
+        return cls(
+            size=selenium_config.get('pool_size', 2),
+            max_pages=selenium_config.get('max_pages_per_worker', 50),
+            page_timeout=selenium_config.get('page_timeout', 10),
+            user_agent=user_agent
+        )
+    
+    def create_driver(self):
+        """启动一个无头Chrome"""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        
+        chrome_options = Options()
+        chrome_options.add_argument('--headless')
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--disable-gpu')
+        if self.user_agent:
+            chrome_options.add_argument(f'user-agent={self.user_agent}')
+        
+        driver = webdriver.Chrome(options=chrome_options)
+        self.count('started')
+        return driver
+    
+    def count(self, key):
+        """更新统计，工作线程中调用"""
+        with self.lock:
+            self.stats[key] += 1
+    
+    def quit_driver(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    
+    def is_alive(self, driver):
+        """浏览器会话是否仍可用"""
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+    
+    def release(self, worker):
+        """页面处理完毕，浏览器放回空闲队列，达到 max_pages 时重建"""
+        worker[1] += 1
+        if worker[1] >= self.max_pages:
+            # 长时间运行的浏览器内存会不断增长，定期重建
+            self.count('recycled')
+            self.quit_driver(worker[0])
+        else:
+            self.idle.put(worker)
+    
+    def load_page(self, url):
+        """在工作线程中加载页面，返回页面源码"""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+        
+        try:
+            worker = self.idle.get_nowait()
+        except queue.Empty:
+            worker = [self.create_driver(), 0]
+        
+        driver = worker[0]
+        try:
+            driver.get(url)
+            
+            # 等待内容加载
+            WebDriverWait(driver, self.page_timeout).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "rich_media_content"))
+            )
+            
+            page_source = driver.page_source
+        except TimeoutException:
+            # 页面没有正文区域（如提示页），浏览器本身正常，继续使用
+            self.count('timeouts')
+            self.release(worker)
+            raise
+        except WebDriverException:
+            # 浏览器崩溃或会话失效，直接丢弃
+            self.count('crashed')
+            self.quit_driver(driver)
+            raise
+        except Exception:
+            # 其他错误（如与浏览器的连接断开）只在会话失效时丢弃
+            if self.is_alive(driver):
+                self.release(worker)
+            else:
+                self.count('crashed')
+                self.quit_driver(driver)
+            raise
+        
+        self.count('pages')
+        self.release(worker)
+        
+        return page_source
+    
+    async def fetch(self, url):
+        """异步获取页面源码，最多同时使用 size 个浏览器"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="browser")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.load_page, url)
+    
+    def close(self):
+        """关闭所有浏览器，之后再次使用时会重新启动"""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+        while True:
+            try:
+                driver, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.quit_driver(driver)
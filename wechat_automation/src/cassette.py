@@ -0,0 +1,231 @@
+import json
+import random
+import asyncio
+import hashlib
+from pathlib import Path
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+
+# 录制时去掉的条件请求头，保证录下的是完整响应
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+class Cassette:
+    """HTTP录制回放存档：responses.jsonl 记录每次响应的状态码、响应头和最终URL，
+    正文按sha256存放在 bodies/ 下，相同内容只存一份
+    
+    同一URL的多次响应按顺序回放，用完后重复最后一次。
+    """
+    
+    def __init__(self, path, mode='replay', latency=0.0, jitter=0.0, throttle_rate=0.0, seed=0,
+                 respect_rate_limit=False):
+        self.path = Path(path)
+        self.bodies_path = self.path / "bodies"
+        self.index_path = self.path / "responses.jsonl"
+        self.mode = mode
+        
+        # 回放时模拟的网络状况
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        # 回放默认不限速，全速运行；模拟限流时可打开
+        self.respect_rate_limit = respect_rate_limit
+        
+        self.responses = {}
+        self.cursors = {}
+        self.stats = {'recorded': 0, 'replayed': 0, 'missing': 0, 'throttled': 0}
+        
+        if mode == 'record':
+            self.bodies_path.mkdir(parents=True, exist_ok=True)
+        elif mode == 'replay':
+            if not self.index_path.exists():
+                raise FileNotFoundError(f"录制文件不存在: {self.index_path}")
+            self.load()
+        else:
+            raise ValueError(f"未知的cassette模式: {mode}")
+    
+    @classmethod
+    def from_config(cls, config):
+        """从 cassette 配置创建，未配置时返回None"""
+        cassette_config = config.get('cassette') or {}
+        if not cassette_config.get('mode'):
+            return None
+        return cls(
+            cassette_config['path'],
+            mode=cassette_config['mode'],
+            latency=cassette_config.get('latency', 0.0),
+            jitter=cassette_config.get('jitter', 0.0),
+            throttle_rate=cassette_config.get('throttle_rate', 0.0),
+            seed=cassette_config.get('seed', 0),
+            respect_rate_limit=cassette_config.get('respect_rate_limit', False)
+        )
+    
+    def load(self):
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.responses.setdefault(record['url'], []).append(record)
+    
+    def body_path(self, sha256):
+        return self.bodies_path / sha256[:2] / sha256
+    
+    def record(self, url, status, headers, final_url, body):
+        """保存一次响应"""
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self.body_path(sha256)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            tmp_path.replace(path)
+        
+        record = {
+            'url': url,
+            'status': status,
+            'headers': list(headers.items()),
+            'final_url': final_url,
+            'sha256': sha256,
+            'size': len(body),
+        }
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.responses.setdefault(url, []).append(record)
+        self.stats['recorded'] += 1
+    
+    def next_record(self, url):
+        """按录制顺序取下一次响应，没有录到时返回None"""
+        records = self.responses.get(url)
+        if not records:
+            return None
+        cursor = self.cursors.get(url, 0)
+        self.cursors[url] = cursor + 1
+        return records[min(cursor, len(records) - 1)]
+    
+    def read_body(self, record):
+        with open(self.body_path(record['sha256']), 'rb') as f:
+            return f.read()
+    
+    def summary(self):
+        stats = self.stats
+        if self.mode == 'record':
+            return f"录制 {stats['recorded']} 个响应 -> {self.path}"
+        return (f"回放 {stats['replayed']} 个响应，缺失 {stats['missing']} 个，"
+                f"模拟限流 {stats['throttled']} 次")
+
+class CassetteContent:
+    """模拟 aiohttp 的 response.content"""
+    
+    def __init__(self, body):
+        self.body = body
+    
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+class CassetteResponse:
+    """内存中的响应，接口与fetcher用到的 aiohttp.ClientResponse 部分一致"""
+    
+    def __init__(self, status, headers, url, body):
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.url = url
+        self.body = body
+        self.content = CassetteContent(body)
+        self.content_length = len(body)
+    
+    async def read(self):
+        return self.body
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+class RecordingSession:
+    """包装真实会话：每个响应完整读取后写入录制文件，再交给调用方"""
+    
+    def __init__(self, session, cassette):
+        self.session = session
+        self.cassette = cassette
+    
+    def get(self, url, headers=None, **kwargs):
+        return ResponseContext(self.fetch(url, headers, kwargs))
+    
+    async def fetch(self, url, headers, kwargs):
+        headers = {
+            key: value for key, value in (headers or {}).items()
+            if key not in CONDITIONAL_HEADERS
+        }
+        async with self.session.get(url, headers=headers, **kwargs) as response:
+            body = await response.read()
+            status, final_url = response.status, str(response.url)
+            response_headers = list(response.headers.items())
+        
+        self.cassette.record(url, status, CIMultiDict(response_headers), final_url, body)
+        return CassetteResponse(status, response_headers, final_url, body)
+    
+    async def close(self):
+        await self.session.close()
+
+class ReplaySession:
+    """从录制文件回放响应，不访问网络，可模拟延迟和限流"""
+    
+    def __init__(self, cassette):
+        self.cassette = cassette
+    
+    def get(self, url, headers=None, **kwargs):
+        return ResponseContext(self.fetch(url, headers or {}))
+    
+    async def fetch(self, url, headers):
+        cassette = self.cassette
+        
+        if cassette.latency or cassette.jitter:
+            await asyncio.sleep(max(0.0, cassette.latency + cassette.random.uniform(-cassette.jitter, cassette.jitter)))
+        
+        if cassette.throttle_rate and cassette.random.random() < cassette.throttle_rate:
+            cassette.stats['throttled'] += 1
+            return CassetteResponse(429, [('Retry-After', '1')], url, b'')
+        
+        record = cassette.next_record(url)
+        if record is None:
+            cassette.stats['missing'] += 1
+            raise aiohttp.ClientConnectionError(f"录制文件中没有该URL: {url}")
+        cassette.stats['replayed'] += 1
+        
+        response_headers = CIMultiDict(record['headers'])
+        
+        # 按录制的ETag/Last-Modified响应条件请求，配合HTTP缓存
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+        if record['status'] == 200 and (
+            (etag and headers.get('If-None-Match') == etag)
+            or (last_modified and headers.get('If-Modified-Since') == last_modified)
+        ):
+            return CassetteResponse(304, record['headers'], record['final_url'], b'')
+        
+        return CassetteResponse(record['status'], record['headers'], record['final_url'],
+                                cassette.read_body(record))
+    
+    async def close(self):
+        pass
+
+class ResponseContext:
+    """让 session.get(...) 可以用于 async with"""
+    
+    def __init__(self, coroutine):
+        self.coroutine = coroutine
+    
+    async def __aenter__(self):
+        return await self.coroutine
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
\ No newline at end of file
@@ -1,10 +1,19 @@
 import os
+import re
 import json
+import math
+import uuid
+import shutil
+import asyncio
 from pathlib import Path
 import google.generativeai as genai
 import yaml
 from typing import List, Dict
 
+from text_digest import load_digests, make_digest
+from image_store import ImageStore
+from token_budget import TokenBudget
+
 class ArticleClassifier:
     """文章分类器，使用Gemini进行智能分类"""
     
@@ -24,6 +33,23 @@ class ArticleClassifier:
         # 加载提示词
         with open('config/prompts/classify.txt', 'r', encoding='utf-8') as f:
             self.classify_prompt = f.read()
+        with open('config/prompts/classify_merge.txt', 'r', encoding='utf-8') as f:
+            self.merge_prompt = f.read()
+        with open('config/prompts/name_cluster.txt', 'r', encoding='utf-8') as f:
+            self.name_prompt = f.read()
+        
+        # 分批分类：每批文章单独分类得到候选主题，再合并同类主题
+        classify_config = self.config.get('classify', {}) or {}
+        # llm: 全部交给模型分类；cluster: 本地向量聚类，模型只为每个簇命名
+        self.mode = classify_config.get('mode', 'llm')
+        self.batch_size = classify_config.get('batch_size', 50)
+        self.merge_batch_size = classify_config.get('merge_batch_size', 80)
+        self.max_concurrency = classify_config.get('max_concurrency', 4)
+        self.retries = classify_config.get('retries', 2)
+        self.semaphore = None
+        
+        # 按token预算分批；dry_run 时只估算调用次数和token数，不调用模型
+        self.budget = TokenBudget.from_config(self.config)
     
     def read_markdown_files(self) -> Dict[str, str]:
         """读取所有Markdown文件"""
@@ -36,101 +62,379 @@ class ArticleClassifier:
         
         return markdown_files
     
-    def classify_articles(self) -> Dict:
+    def read_digests(self) -> List[Dict]:
+        """读取转换时生成的文章摘要，旧版转换结果没有摘要时从Markdown文件生成"""
+        digests = load_digests(self.markdown_path)
+        if digests is not None:
+            # 近似重复的文章只保留一篇参与分类
+            duplicates = [digest for digest in digests if digest.get('duplicate_of')]
+            if duplicates:
+                print(f"跳过 {len(duplicates)} 篇重复文章")
+            return [digest for digest in digests if not digest.get('duplicate_of')]
+        
+        print("未找到文章摘要（digests.json），将读取Markdown全文，重新运行 convert 可生成摘要")
+        return [
+            make_digest(Path(filename).stem, content.split("\n", 1)[0].lstrip("# ").strip(), content)
+            for filename, content in self.read_markdown_files().items()
+        ]
+    
+    def format_digest(self, digest: Dict) -> str:
+        """单篇文章在提示词中的预览：标题、关键词和正文开头"""
+        lines = [f"文件名: {digest['id']}.md", f"标题: {digest['title']}"]
+        if digest.get('keywords'):
+            lines.append(f"关键词: {'、'.join(digest['keywords'][:10])}")
+        lines.append(digest['lead'])
+        return "\n".join(lines)
+    
+    def classify_articles(self, mode: str = None) -> Dict:
         """对文章进行分类"""
-        # 读取所有Markdown文件
-        markdown_files = self.read_markdown_files()
+        # 读取文章摘要，不读取全文
+        digests = self.read_digests()
         
-        if not markdown_files:
+        if not digests:
             print("未找到Markdown文件，请先转换文章")
             return {}
         
-        print(f"正在对 {len(markdown_files)} 篇文章进行分类...")
+        mode = mode or self.mode
+        print(f"正在对 {len(digests)} 篇文章进行分类..." + ("（本地聚类）" if mode == 'cluster' else ""))
         
-        # 构建提示内容
+        try:
+            if mode == 'cluster':
+                return asyncio.run(self.classify_clustered(digests))
+            return asyncio.run(self.classify_batched(digests))
+        except Exception as e:
+            print(f"分类时出错: {e}")
+            return {}
+    
+    async def generate_json(self, prompt: str, label: str):
+        """调用Gemini并提取JSON结果，失败时重试，最终失败返回None"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(2 ** attempt)
+            try:
+                async with self.semaphore:
+                    response = await self.model.generate_content_async(prompt)
+                json_match = re.search(r'\{.*\}', response.text, re.DOTALL)
+                if json_match:
+                    return json.loads(json_match.group())
+                print(f"{label}: 无法解析分类结果（第{attempt + 1}次）")
+            except Exception as e:
+                print(f"{label}: 调用出错（第{attempt + 1}次）: {e}")
+        return None
+    
+    def combine_themes(self, theme_name: str, description: str, themes: List[Dict]) -> Dict:
+        """把多个候选主题合并为一个，文章按ID去重"""
+        merged = {'theme_name': theme_name, 'description': description, 'articles': [], 'article_ids': []}
+        for theme in themes:
+            for title, article_id in zip(theme['articles'], theme['article_ids']):
+                if article_id not in merged['article_ids']:
+                    merged['articles'].append(title)
+                    merged['article_ids'].append(article_id)
+        return merged
+    
+    def batch_prompt(self, batch: List[Dict]) -> str:
         articles_content = "\n\n---\n\n".join([
-            f"文件名: {filename}\n{content[:1000]}..."  # 只传递前1000字符作为预览
-            for filename, content in markdown_files.items()
+            self.format_digest(digest) for digest in batch
         ])
+        return self.classify_prompt + "\n\n文章内容：\n" + articles_content
+    
+    def split_batches(self, digests: List[Dict]) -> List[List[Dict]]:
+        """按顺序把文章分批：每批不超过 batch_size 篇，提示词不超过分类阶段的token上限"""
+        return self.budget.pack(
+            digests, self.budget.limit('classify'),
+            cost=lambda digest: self.budget.count(self.format_digest(digest)) + 2,
+            overhead=self.budget.count(self.classify_prompt) + 10,
+            max_items=self.batch_size,
+        )
+    
+    async def classify_batch(self, index: int, batch: List[Dict]):
+        """对一批文章分类，返回候选主题列表，失败时返回None"""
+        result = await self.generate_json(self.batch_prompt(batch), f"第{index + 1}批")
+        if not result or not isinstance(result.get('themes'), list):
+            return None
+        
+        # 模型返回的是文件名（文章ID.md），只按ID对应回本批的文章，标题可能重复
+        by_id = {digest['id']: digest for digest in batch}
+        
+        themes = []
+        unknown = []
+        for theme in result['themes']:
+            members = []
+            for name in theme.get('articles', []):
+                name = str(name).strip()
+                digest = by_id.get(name[:-3] if name.endswith('.md') else name)
+                if digest:
+                    members.append(digest)
+                else:
+                    unknown.append(name)
+            if members:
+                themes.append(self.combine_themes(
+                    theme.get('theme_name', '未命名主题'), theme.get('description', ''),
+                    [{'articles': [digest['title'] for digest in members],
+                      'article_ids': [digest['id'] for digest in members]}]
+                ))
         
-        # 调用Gemini进行分类
+        if unknown:
+            print(f"第{index + 1}批: {len(unknown)} 个文件名不属于本批文章，已忽略: {', '.join(unknown[:10])}")
+        print(f"第{index + 1}批分类完成：{len(batch)} 篇文章，{len(themes)} 个候选主题")
+        return themes
+    
+    def format_candidate(self, number: int, theme: Dict) -> str:
+        """候选主题在合并提示词中的一行"""
+        return (f"[{number}] {theme['theme_name']}（{len(theme['article_ids'])}篇）: {theme['description']}"
+                f"；示例文章: {'；'.join(theme['articles'][:3])}")
+    
+    def split_candidates(self, candidates: List[Dict]) -> List[List[Dict]]:
+        """把候选主题分组：每组不超过 merge_batch_size 个，提示词不超过合并阶段的token上限"""
+        return self.budget.pack(
+            candidates, self.budget.limit('merge'),
+            cost=lambda theme: self.budget.count(self.format_candidate(len(candidates), theme)),
+            overhead=self.budget.count(self.merge_prompt) + 10,
+            max_items=self.merge_batch_size,
+        )
+    
+    async def merge_candidates(self, candidates: List[Dict], label: str) -> List[Dict]:
+        """让模型合并讨论同一事物的候选主题，失败或遗漏的候选主题保持原样"""
+        listing = "\n".join(self.format_candidate(i + 1, theme) for i, theme in enumerate(candidates))
+        result = await self.generate_json(self.merge_prompt + "\n\n候选主题：\n" + listing, label)
+        if not result or not isinstance(result.get('themes'), list):
+            print(f"{label}: 合并失败，保留 {len(candidates)} 个候选主题")
+            return candidates
+        
+        merged = []
+        used = set()
+        for theme in result['themes']:
+            group = []
+            for number in theme.get('candidates', []):
+                if isinstance(number, int) and 0 < number <= len(candidates) and number - 1 not in used:
+                    used.add(number - 1)
+                    group.append(candidates[number - 1])
+            if group:
+                merged.append(self.combine_themes(
+                    theme.get('theme_name') or group[0]['theme_name'],
+                    theme.get('description', group[0]['description']), group
+                ))
+        merged.extend(theme for i, theme in enumerate(candidates) if i not in used)
+        
+        print(f"{label}: {len(candidates)} 个候选主题合并为 {len(merged)} 个")
+        return merged
+    
+    async def reduce_themes(self, candidates: List[Dict]) -> List[Dict]:
+        """逐轮合并候选主题，直到一次合并即可放进一个提示词"""
+        round_number = 1
+        while len(self.split_candidates(candidates)) > 1:
+            # 按名称排序，名称相近的主题尽量分在同一组
+            candidates = sorted(candidates, key=lambda theme: theme['theme_name'])
+            groups = self.split_candidates(candidates)
+            merged = await asyncio.gather(*[
+                self.merge_candidates(group, f"第{round_number}轮合并第{n + 1}组")
+                for n, group in enumerate(groups)
+            ])
+            merged = [theme for group in merged for theme in group]
+            if len(merged) >= len(candidates):
+                print(f"候选主题无法继续合并，保留 {len(merged)} 个主题")
+                return merged
+            candidates = merged
+            round_number += 1
+        
+        return await self.merge_candidates(candidates, "最终合并")
+    
+    async def classify_batched(self, digests: List[Dict]) -> Dict:
+        """分批并发分类，再合并各批的候选主题；只有一批时直接使用该批结果"""
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = self.split_batches(digests)
+        if len(batches) > 1:
+            print(f"分为 {len(batches)} 批，每批最多 {self.batch_size} 篇，同时处理 {self.max_concurrency} 批")
+        
+        if self.budget.dry_run:
+            for batch in batches:
+                self.budget.record('classify', self.batch_prompt(batch), self.max_concurrency)
+            if len(batches) > 1:
+                self.plan_merges(batches)
+            return {}
+        
+        results = await asyncio.gather(*[
+            self.classify_batch(index, batch) for index, batch in enumerate(batches)
+        ])
+        
+        failed = [index for index, result in enumerate(results) if result is None]
+        if failed:
+            failed_count = sum(len(batches[index]) for index in failed)
+            print(f"{len(failed)} 批分类失败，其中 {failed_count} 篇文章未归类，可重新运行分类")
+        
+        candidates = [theme for result in results if result for theme in result]
+        if not candidates:
+            print("无法解析分类结果")
+            return {}
+        
+        themes = candidates if len(batches) == 1 else await self.reduce_themes(candidates)
+        return {'themes': themes}
+    
+    def plan_merges(self, batches: List[List[Dict]]):
+        """dry-run时估算合并调用：候选主题数取决于模型的分类结果，按每批至多10个、每轮合并减半估算"""
+        listing_tokens = 60
+        count = sum(min(len(batch), 10) for batch in batches)
+        overhead = self.budget.count(self.merge_prompt) + 10
+        per_group = max(2, min(self.merge_batch_size, (self.budget.limit('merge') - overhead) // listing_tokens))
+        while count > per_group:
+            groups = math.ceil(count / per_group)
+            for position in range(groups):
+                size = min(per_group, count - position * per_group)
+                self.budget.record_tokens('merge', overhead + size * listing_tokens, self.max_concurrency)
+            count = max(groups, count // 2)
+        self.budget.record_tokens('merge', overhead + count * listing_tokens, self.max_concurrency)
+        print("合并主题的调用按每批至多10个候选主题、每轮合并减半估算")
+    
+    def cluster_prompt(self, cluster: Dict, by_id: Dict[str, Dict]) -> str:
+        """簇的命名提示词：代表文章的摘要和其他文章的标题"""
+        others = [by_id[article_id]['title'] for article_id in cluster['article_ids']
+                  if article_id not in cluster['representatives']]
+        
+        prompt = self.name_prompt + "\n\n代表文章：\n" + "\n\n---\n\n".join([
+            self.format_digest(by_id[article_id]) for article_id in cluster['representatives']
+        ])
+        if others:
+            prompt += f"\n\n本组共 {len(cluster['article_ids'])} 篇文章，其他文章标题：\n" + "\n".join(others[:20])
+        return prompt
+    
+    async def name_cluster(self, index: int, cluster: Dict, by_id: Dict[str, Dict]) -> Dict:
+        """只把簇的代表文章和其他文章标题交给模型命名"""
+        titles = [by_id[article_id]['title'] for article_id in cluster['article_ids']]
+        result = await self.generate_json(self.cluster_prompt(cluster, by_id), f"第{index + 1}组")
+        if result and result.get('theme_name'):
+            theme_name, description = result['theme_name'], result.get('description', '')
+        else:
+            keywords = by_id[cluster['representatives'][0]].get('keywords', [])[:3]
+            theme_name, description = f"主题{index + 1}" + (f"：{'、'.join(keywords)}" if keywords else ""), ""
+        
+        print(f"第{index + 1}组（{len(titles)} 篇）: {theme_name}")
+        return self.combine_themes(theme_name, description,
+                                   [{'articles': titles, 'article_ids': cluster['article_ids']}])
+    
+    async def classify_clustered(self, digests: List[Dict]) -> Dict:
+        """本地向量聚类后，每个簇只调用一次模型命名；名称相同的簇合并为一个主题"""
         try:
-            prompt = self.classify_prompt + "\n\n文章内容：\n" + articles_content
-            response = self.model.generate_content(prompt)
-            
-            # 解析JSON响应
-            result_text = response.text
-            
-            # 提取JSON部分
-            import re
-            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if json_match:
-                classification_result = json.loads(json_match.group())
-            else:
-                print("无法解析分类结果")
-                return {}
-            
-        except Exception as e:
-            print(f"分类时出错: {e}")
+            from vector_cluster import ArticleClusterer
+        except ImportError:
+            print("聚类模式需要numpy和scipy: pip install numpy scipy")
             return {}
         
-        return classification_result
+        clusters = ArticleClusterer.from_config(self.config).cluster(digests)
+        by_id = {digest['id']: digest for digest in digests}
+        if self.budget.dry_run:
+            print(f"本地聚类完成：{len(clusters)} 个簇")
+            for cluster in clusters:
+                self.budget.record('name', self.cluster_prompt(cluster, by_id), self.max_concurrency)
+            return {}
+        print(f"本地聚类完成：{len(clusters)} 个簇，正在为每个簇命名...")
+        
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        named = await asyncio.gather(*[
+            self.name_cluster(index, cluster, by_id) for index, cluster in enumerate(clusters)
+        ])
+        
+        themes = {}
+        for theme in named:
+            if theme['theme_name'] in themes:
+                existing = themes[theme['theme_name']]
+                themes[theme['theme_name']] = self.combine_themes(
+                    existing['theme_name'], existing['description'], [existing, theme])
+            else:
+                themes[theme['theme_name']] = theme
+        return {'themes': list(themes.values())}
     
-    def organize_by_themes(self, classification_result: Dict):
-        """根据分类结果组织文件"""
+    def link_articles(self, theme_path: Path, article_ids: List[str]) -> int:
+        """在临时目录中为主题的文章建立链接（硬链接，其次符号链接，最后复制），再整体替换 articles 目录
+        
+        articles 是指向当前版本目录的符号链接，替换时原子地改指向新目录，读取方不会看到半成品；
+        不支持符号链接的系统上改为目录重命名。返回链接的文章数。
+        """
+        staged = theme_path / f".articles-{uuid.uuid4().hex[:8]}"
+        staged.mkdir()
+        linked = 0
+        for article_id in article_ids:
+            src_path = self.markdown_path / f"{article_id}.md"
+            if src_path.exists():
+                ImageStore.link(src_path, staged / src_path.name)
+                linked += 1
+            else:
+                print(f"找不到文章文件，跳过: {src_path}")
+        
+        articles_path = theme_path / "articles"
+        previous = Path(os.readlink(articles_path)).name if articles_path.is_symlink() else None
+        tmp_link = theme_path / ".articles.link"
+        try:
+            if tmp_link.is_symlink():
+                tmp_link.unlink()
+            os.symlink(staged.name, tmp_link, target_is_directory=True)
+            if articles_path.exists() and not articles_path.is_symlink():
+                # 旧版的普通目录，先移开（只在第一次发生）
+                previous = f".articles-old-{uuid.uuid4().hex[:8]}"
+                articles_path.rename(theme_path / previous)
+            os.replace(tmp_link, articles_path)
+        except OSError:
+            if tmp_link.is_symlink():
+                tmp_link.unlink()
+            previous = None
+            if articles_path.exists():
+                previous = f".articles-old-{uuid.uuid4().hex[:8]}"
+                articles_path.rename(theme_path / previous)
+            staged.rename(articles_path)
+        
+        if previous:
+            shutil.rmtree(theme_path / previous, ignore_errors=True)
+        return linked
+    
+    def organize_by_themes(self, classification_result: Dict, changed_themes=None):
+        """根据分类结果组织文件，指定 changed_themes 时只整理这些主题的文件夹
+        
+        主题成员按文章ID记录在 metadata.json 中，articles 目录只放指向Markdown文件的链接；
+        成员没有变化的主题不重新整理，素材库和草稿不受影响
+        """
         if 'themes' not in classification_result:
             print("分类结果格式错误")
             return
         
-        # 读取Markdown索引
+        # 读取Markdown索引，旧版分类结果只有标题时按标题补上文章ID
         markdown_index_path = self.markdown_path / "index.json"
         with open(markdown_index_path, 'r', encoding='utf-8') as f:
             markdown_index = json.load(f)
-        
-        # 创建标题到文件名的映射
-        title_to_filename = {
-            article['title']: article['id'] + '.md'
-            for article in markdown_index
-        }
+        self.with_article_ids(classification_result, markdown_index)
         
         for theme in classification_result['themes']:
             theme_name = theme['theme_name']
+            if changed_themes is not None and theme_name not in changed_themes:
+                continue
             theme_desc = theme.get('description', '')
             articles = theme['articles']
+            article_ids = theme['article_ids']
             
             # 创建主题文件夹
             theme_path = self.themes_path / theme_name
             theme_path.mkdir(exist_ok=True)
             
-            # 创建文章子文件夹
-            articles_path = theme_path / "articles"
-            articles_path.mkdir(exist_ok=True)
+            metadata_path = theme_path / "metadata.json"
+            previous_ids = None
+            if metadata_path.exists():
+                with open(metadata_path, 'r', encoding='utf-8') as f:
+                    previous_ids = json.load(f).get('article_ids')
             
-            # 复制文章到主题文件夹
-            for article_title in articles:
-                if article_title in title_to_filename:
-                    filename = title_to_filename[article_title]
-                    src_path = self.markdown_path / filename
-                    dst_path = articles_path / filename
-                    
-                    if src_path.exists():
-                        # 读取并复制文件
-                        with open(src_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        with open(dst_path, 'w', encoding='utf-8') as f:
-                            f.write(content)
-                        
-                        print(f"已归类: {article_title} -> {theme_name}")
+            # 成员没有变化时保留现有链接（硬链接和符号链接都会反映Markdown的更新）
+            if previous_ids == article_ids and (theme_path / "articles").exists():
+                print(f"主题未变化: {theme_name}（{len(article_ids)} 篇）")
+            else:
+                linked = self.link_articles(theme_path, article_ids)
+                print(f"已归类: {theme_name}（{linked} 篇）")
             
             # 保存主题元数据
             theme_metadata = {
                 'theme_name': theme_name,
                 'description': theme_desc,
                 'articles': articles,
-                'article_count': len(articles)
+                'article_ids': article_ids,
+                'article_count': len(article_ids)
             }
             
-            metadata_path = theme_path / "metadata.json"
             with open(metadata_path, 'w', encoding='utf-8') as f:
                 json.dump(theme_metadata, f, ensure_ascii=False, indent=2)
         
@@ -141,14 +445,136 @@ class ArticleClassifier:
         
         print(f"\n分类完成！共创建 {len(classification_result['themes'])} 个主题分组")
     
-    def run(self):
-        """运行分类流程"""
+    def with_article_ids(self, classification_result: Dict, digests: List[Dict]) -> Dict:
+        """旧版分类结果中的主题只有文章标题，按标题补上文章ID"""
+        by_title = {digest['title']: digest['id'] for digest in digests}
+        for theme in classification_result.get('themes', []):
+            if 'article_ids' not in theme:
+                pairs = [(title, by_title[title]) for title in theme['articles'] if title in by_title]
+                theme['articles'] = [title for title, _ in pairs]
+                theme['article_ids'] = [article_id for _, article_id in pairs]
+        return classification_result
+    
+    def build_theme_index(self, classification_result: Dict):
+        """完整分类后重建主题向量索引，供增量分类使用"""
+        try:
+            from vector_cluster import ThemeIndex
+        except ImportError:
+            print("未安装numpy和scipy，跳过主题向量索引（增量分类需要: pip install numpy scipy）")
+            return
+        
+        digests = self.read_digests()
+        index = ThemeIndex.from_config(self.config)
+        index.build(self.with_article_ids(classification_result, digests)['themes'], digests)
+        index.save()
+        print(f"主题向量索引已更新：{len(index.names)} 个主题，{len(index.pending)} 篇文章未归类")
+    
+    def classify_incremental(self) -> Dict:
+        """把新文章归入已有主题，不重新分类已有文章；待定文章足够多时才让模型命名新主题"""
+        try:
+            from vector_cluster import ThemeIndex
+        except ImportError:
+            print("增量分类需要numpy和scipy: pip install numpy scipy")
+            return None
+        
+        index = ThemeIndex.from_config(self.config)
+        classification_path = self.themes_path / "classification.json"
+        if not index.exists() or not classification_path.exists():
+            print("尚未建立主题索引，先进行一次完整分类")
+            return self.run()
+        index.load()
+        
+        digests = self.read_digests()
+        by_id = {digest['id']: digest for digest in digests}
+        # 已删除或被标记为重复的待定文章不再考虑
+        index.pending = [article_id for article_id in index.pending if article_id in by_id]
+        known = set(index.assigned) | set(index.pending)
+        new_digests = [digest for digest in digests if digest['id'] not in known]
+        
+        with open(classification_path, 'r', encoding='utf-8') as f:
+            classification_result = self.with_article_ids(json.load(f), digests)
+        
+        if not new_digests and len(index.pending) < index.min_new_theme:
+            print("没有需要归类的新文章")
+            if not self.budget.dry_run:
+                index.save()
+            return classification_result
+        
+        print(f"正在把 {len(new_digests)} 篇新文章归入 {len(index.names)} 个已有主题...")
+        assignments, unassigned = index.assign(new_digests)
+        for theme_name, article_ids in assignments.items():
+            print(f"  {theme_name}: +{len(article_ids)} 篇")
+        print(f"{len(unassigned)} 篇文章与已有主题都不相近，待定文章共 {len(index.pending)} 篇")
+        
+        # 待定文章足够多时聚类，只为足够大的簇命名新主题
+        new_themes = []
+        clusters = index.pending_clusters([by_id[article_id] for article_id in index.pending])
+        if self.budget.dry_run:
+            # 归类和聚类都在本地完成，只估算新主题的命名调用，不保存索引和分类结果
+            print(f"待定文章中发现 {len(clusters)} 个新主题")
+            for cluster in clusters:
+                self.budget.record('name', self.cluster_prompt(cluster, by_id), self.max_concurrency)
+            return None
+        if clusters:
+            print(f"待定文章中发现 {len(clusters)} 个新主题，正在命名...")
+            
+            async def name_all():
+                self.semaphore = asyncio.Semaphore(self.max_concurrency)
+                return await asyncio.gather(*[
+                    self.name_cluster(position, cluster, by_id) for position, cluster in enumerate(clusters)
+                ])
+            
+            for cluster, theme in zip(clusters, asyncio.run(name_all())):
+                index.add_theme(theme['theme_name'], cluster)
+                new_themes.append(theme)
+            
+            # 剩余的待定文章可能与新主题相近
+            more, _ = index.assign([by_id[article_id] for article_id in index.pending], new=False)
+            for theme_name, article_ids in more.items():
+                assignments.setdefault(theme_name, []).extend(article_ids)
+        
+        # 更新分类结果，只整理有变化的主题文件夹
+        themes = {theme['theme_name']: theme for theme in classification_result['themes']}
+        for theme in new_themes:
+            existing = themes.get(theme['theme_name'])
+            themes[theme['theme_name']] = self.combine_themes(
+                theme['theme_name'], existing['description'] if existing else theme['description'],
+                [existing, theme] if existing else [theme]
+            )
+        for theme_name, article_ids in assignments.items():
+            added = {'articles': [by_id[article_id]['title'] for article_id in article_ids], 'article_ids': article_ids}
+            theme = themes[theme_name]
+            themes[theme_name] = self.combine_themes(theme_name, theme.get('description', ''), [theme, added])
+        classification_result['themes'] = list(themes.values())
+        
+        changed = set(assignments) | {theme['theme_name'] for theme in new_themes}
+        if changed:
+            self.organize_by_themes(classification_result, changed)
+        index.save()
+        return classification_result
+    
+    def run(self, mode: str = None, incremental: bool = False, dry_run: bool = False):
+        """运行分类流程，dry_run 时只报告预计的模型调用次数、token数和耗时"""
+        if dry_run:
+            self.budget.dry_run = True
+            if incremental:
+                self.classify_incremental()
+            else:
+                self.classify_articles(mode)
+            print("\n[dry-run] 预计的模型调用：")
+            print(self.budget.report())
+            return None
+        
+        if incremental:
+            return self.classify_incremental()
+        
         # 执行分类
-        classification_result = self.classify_articles()
+        classification_result = self.classify_articles(mode)
         
         if classification_result:
             # 组织文件
             self.organize_by_themes(classification_result)
+            self.build_theme_index(classification_result)
             return classification_result
         else:
             return None
@@ -2,9 +2,239 @@ import os
 import json
 from pathlib import Path
 from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from lxml import html as lxml_html
+from markdownify import MarkdownConverter
 import yaml
 import re
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from article_index import ArticleIndex
+from image_store import ImageStore
+from raw_store import RawStore
+from article_parser import parse_article, image_url, to_html, PROFILES
+from text_digest import DIGEST_VERSION, make_digest, save_digests
+from dedup import Deduplicator
+
+# 转换结果的格式变化时加1，清单中版本不同的文章会重新转换
+CONVERTER_VERSION = 3
+
+# 块级元素，遇到时结束当前段落
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'center', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+    'ol', 'p', 'pre', 'section', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul',
+    'body', 'html',
+}
+
+# 不输出内容的元素
+SKIP_TAGS = {'head', 'title', 'meta', 'link', 'script', 'style', 'noscript', 'iframe', 'svg', 'mpvoice', 'mpprofile'}
+
+# 段落内换行的占位符，段落结束时替换为Markdown硬换行
+LINE_BREAK = '\x00'
+
+WHITESPACE = re.compile(r'[ \t\r\n\f\xa0]+')
+BOLD_STYLE = re.compile(r'font-weight\s*:\s*(bold|[6-9]00)')
+ITALIC_STYLE = re.compile(r'font-style\s*:\s*italic')
+HIDDEN_STYLE = re.compile(r'display\s*:\s*none')
+LIST_ITEM = re.compile(r'(- |\d+\. )')
+
+class BlockInInline(Exception):
+    """行内元素中出现了块级元素（微信排版中常见），改按块处理"""
+
+class WechatMarkdownRenderer:
+    """针对微信文章DOM的Markdown渲染器：单次遍历lxml元素树，直接生成整洁的Markdown
+    
+    嵌套的section/div只作为段落边界，带样式的span按font-weight/font-style输出粗体和斜体，
+    图片优先使用本地src，其次data-src。
+    """
+    
+    def render(self, element):
+        """把元素渲染为Markdown"""
+        blocks = self.block(element)
+        return '\n\n'.join(blocks) + '\n' if blocks else ''
+    
+    def escape(self, text):
+        return text.replace('*', '\\*').replace('_', '\\_') if text else ''
+    
+    def is_hidden(self, element):
+        style = element.get('style')
+        return bool(style) and HIDDEN_STYLE.search(style) is not None
+    
+    def finish_paragraph(self, parts):
+        """合并段落内的文本：压缩空白，处理换行"""
+        text = WHITESPACE.sub(' ', ''.join(parts))
+        lines = [line.strip() for line in text.split(LINE_BREAK)]
+        # 去掉段落首尾的空行（如 <p><br></p>）
+        while lines and not lines[0]:
+            lines.pop(0)
+        while lines and not lines[-1]:
+            lines.pop()
+        return '  \n'.join(lines)
+    
+    def render_blocks(self, element):
+        """渲染块级容器的内容，返回块列表"""
+        blocks = []
+        parts = [self.escape(element.text)]
+        
+        def flush():
+            paragraph = self.finish_paragraph(parts)
+            if paragraph:
+                blocks.append(paragraph)
+            parts.clear()
+        
+        for child in element:
+            tag = child.tag if isinstance(child.tag, str) else None
+            if tag is None or tag in SKIP_TAGS or self.is_hidden(child):
+                pass
+            elif tag in BLOCK_TAGS:
+                flush()
+                blocks.extend(self.block(child))
+            else:
+                try:
+                    parts.append(self.inline(child, False, False))
+                except BlockInInline:
+                    flush()
+                    blocks.extend(self.render_blocks(child))
+            parts.append(self.escape(child.tail))
+        
+        flush()
+        return blocks
+    
+    def block(self, element):
+        """渲染一个块级元素，返回块列表"""
+        tag = element.tag
+        if tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            text = ' '.join(self.render_blocks(element)).replace('  \n', ' ')
+            return [f"{'#' * int(tag[1])} {text}"] if text else []
+        if tag in ('ul', 'ol'):
+            return self.list_block(element)
+        if tag == 'blockquote':
+            inner = '\n\n'.join(self.render_blocks(element))
+            if not inner:
+                return []
+            return ['\n'.join(f"> {line}" if line else '>' for line in inner.split('\n'))]
+        if tag == 'pre':
+            return [self.code_block(element)]
+        if tag == 'table':
+            return self.table_block(element)
+        if tag == 'hr':
+            return ['---']
+        if tag == 'img':
+            image = self.image(element)
+            return [image] if image else []
+        return self.render_blocks(element)
+    
+    def list_block(self, element):
+        ordered = element.tag == 'ol'
+        items = []
+        for child in element:
+            if child.tag != 'li' or self.is_hidden(child):
+                continue
+            content = ''
+            for block in self.render_blocks(child):
+                # 嵌套列表紧跟在上一行之后
+                separator = '\n' if LIST_ITEM.match(block) else '\n\n'
+                content = content + separator + block if content else block
+            if not content:
+                continue
+            marker = f"{len(items) + 1}. " if ordered else '- '
+            indent = ' ' * len(marker)
+            lines = content.split('\n')
+            items.append(marker + lines[0] + ''.join(
+                '\n' + (indent + line if line else '') for line in lines[1:]
+            ))
+        return ['\n'.join(items)] if items else []
+    
+    def code_text(self, element):
+        """代码文本，保留原有空白，<br>和逐行的<code>转为换行"""
+        parts = [element.text or '']
+        for child in element:
+            if child.tag == 'br':
+                parts.append('\n')
+            elif isinstance(child.tag, str):
+                parts.append(self.code_text(child))
+                if child.tag == 'code' and child.getnext() is not None and child.getnext().tag == 'code':
+                    parts.append('\n')
+            parts.append(child.tail or '')
+        return ''.join(parts)
+    
+    def code_block(self, element):
+        language = ''
+        match = re.search(r'code-snippet__(\w+)', element.get('class') or '')
+        if match:
+            language = match.group(1)
+        code = self.code_text(element).replace('\xa0', ' ').strip('\n')
+        return f"```{language}\n{code}\n```"
+    
+    def table_block(self, element):
+        rows = []
+        for tr in element.iter('tr'):
+            cells = [' '.join(self.render_blocks(cell)).replace('  \n', ' ').replace('|', '\\|')
+                     for cell in tr if cell.tag in ('td', 'th')]
+            if cells:
+                rows.append(cells)
+        if not rows:
+            return []
+        width = max(len(row) for row in rows)
+        rows = [row + [''] * (width - len(row)) for row in rows]
+        lines = ['| ' + ' | '.join(rows[0]) + ' |', '| ' + ' | '.join(['---'] * width) + ' |']
+        lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+        return ['\n'.join(lines)]
+    
+    def image(self, element):
+        src = element.get('src')
+        if not src or src.startswith('data:'):
+            src = element.get('data-src') or ''
+        if not src:
+            return ''
+        return f"![{element.get('alt') or ''}]({src})"
+    
+    def inline(self, element, bold, italic):
+        """渲染行内元素，bold/italic 表示外层已经是粗体/斜体"""
+        tag = element.tag
+        if tag in SKIP_TAGS or self.is_hidden(element):
+            return ''
+        if tag == 'img':
+            return self.image(element)
+        if tag == 'br':
+            return LINE_BREAK
+        if tag == 'code':
+            code = WHITESPACE.sub(' ', element.text_content()).strip()
+            return f"`{code}`" if code else ''
+        
+        style = element.get('style') or ''
+        make_bold = not bold and (tag in ('strong', 'b') or BOLD_STYLE.search(style) is not None)
+        make_italic = not italic and (tag in ('em', 'i') or ITALIC_STYLE.search(style) is not None)
+        
+        parts = [self.escape(element.text)]
+        for child in element:
+            if isinstance(child.tag, str):
+                if child.tag in BLOCK_TAGS:
+                    raise BlockInInline()
+                parts.append(self.inline(child, bold or make_bold, italic or make_italic))
+            parts.append(self.escape(child.tail))
+        text = ''.join(parts)
+        
+        if tag == 'a':
+            href = element.get('href') or ''
+            label = WHITESPACE.sub(' ', text).strip()
+            if label and href and not href.startswith('javascript:'):
+                return f"[{label}]({href})"
+            return text
+        
+        if make_bold or make_italic:
+            content = text.strip(' \t\r\n\f\xa0')
+            if not content or content == LINE_BREAK:
+                return text
+            mark = ('**' if make_bold else '') + ('*' if make_italic else '')
+            # 标记紧贴文字，空白放到标记外面
+            lead = ' ' if text[:1].isspace() else ''
+            trail = ' ' if text[-1:].isspace() else ''
+            return f"{lead}{mark}{content}{mark[::-1]}{trail}"
+        
+        return text
 
 class HtmlToMarkdownConverter:
     """HTML转Markdown转换器"""
@@ -13,63 +243,62 @@ class HtmlToMarkdownConverter:
         with open(config_path, 'r', encoding='utf-8') as f:
             self.config = yaml.safe_load(f)
         
+        self.config_path = config_path
         self.raw_articles_path = Path(self.config['paths']['raw_articles'])
         self.markdown_path = Path(self.config['paths']['markdown'])
         self.markdown_path.mkdir(parents=True, exist_ok=True)
-    
-    def clean_html(self, html_content):
-        """清理HTML内容"""
-        soup = BeautifulSoup(html_content, 'html.parser')
         
-        # 移除script和style标签
-        for script in soup(["script", "style"]):
-            script.decompose()
+        # 增量转换清单
+        self.manifest_path = self.markdown_path / "manifest.json"
         
-        # 获取rich_media_content内容
-        content_div = soup.find('div', class_='rich_media_content')
-        if content_div:
-            return str(content_div)
+        # 并行转换的进程数，1表示在当前进程中逐篇转换
+        self.workers = self.config.get('system', {}).get('convert_workers', 1)
         
-        return str(soup)
+        # Markdown渲染方式：wechat（专用渲染器）或 markdownify
+        converter_config = self.config.get('converter', {}) or {}
+        self.renderer = converter_config.get('renderer', 'wechat')
+        self.wechat_renderer = WechatMarkdownRenderer()
+        
+        # 摘要中正文开头摘录的字数
+        self.excerpt_chars = converter_config.get('excerpt_chars', 600)
     
-    def process_images(self, html_content, image_mapping):
-        """处理HTML中的图片链接"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+    def clean_html(self, html_content):
+        """清理HTML内容，返回正文区域的元素（lxml只解析一次，已移除script和style）"""
+        parsed = parse_article(html_content, 'converter')
+        if parsed is None:
+            return lxml_html.fragment_fromstring('<div></div>')
         
-        for img in soup.find_all('img'):
+        # 获取rich_media_content内容，找不到时使用整个页面
+        return parsed['content'][0]
+    
+    def process_images(self, content, image_mapping):
+        """处理正文中的图片链接，直接修改元素树"""
+        for img in content.iter('img'):
             # 获取原始URL
-            img_url = None
-            for attr in ['data-src', 'src']:
-                if img.get(attr):
-                    img_url = img.get(attr)
-                    break
+            img_url = image_url(img, PROFILES['converter']['image_attrs'])
             
             # 如果在映射中找到本地路径，替换URL
             if img_url and img_url in image_mapping:
                 local_path = image_mapping[img_url]
                 # 转换为相对路径
                 relative_path = os.path.relpath(local_path, self.markdown_path)
-                img['src'] = relative_path
+                img.set('src', relative_path)
                 
                 # 添加alt文本
                 if not img.get('alt'):
-                    img['alt'] = f"图片"
+                    img.set('alt', f"图片")
         
-        return str(soup)
+        return content
     
-    def html_to_markdown(self, html_content, title=""):
-        """将HTML转换为Markdown"""
-        # 使用markdownify进行转换
-        markdown_content = md(
-            html_content,
-            heading_style="ATX",
-            bullets="-",
-            code_language="python",
-            strip=['script', 'style']
-        )
-        
-        # 清理多余的空行
-        markdown_content = re.sub(r'\n{3,}', '\n\n', markdown_content)
+    def html_to_markdown(self, content, title=""):
+        """将正文元素（或HTML字符串）转换为Markdown"""
+        if self.renderer == 'markdownify':
+            markdown_content = self.markdownify(content)
+        else:
+            if isinstance(content, str):
+                content = lxml_html.fragment_fromstring(content, create_parent='div')
+            # 单次遍历元素树，输出不含多余空行
+            markdown_content = self.wechat_renderer.render(content)
         
         # 添加标题
         if title:
@@ -77,6 +306,23 @@ class HtmlToMarkdownConverter:
         
         return markdown_content
     
+    def markdownify(self, content):
+        """使用markdownify转换（旧版方式）"""
+        if not isinstance(content, str):
+            content = to_html([content])
+        
+        # 只重新解析正文区域
+        soup = BeautifulSoup(content, 'lxml')
+        markdown_content = MarkdownConverter(
+            heading_style="ATX",
+            bullets="-",
+            code_language="python",
+            strip=['script', 'style']
+        ).convert_soup(soup)
+        
+        # 清理多余的空行
+        return re.sub(r'\n{3,}', '\n\n', markdown_content)
+    
     def convert_article(self, article_metadata):
         """转换单篇文章"""
         article_id = article_metadata['id']
@@ -84,18 +330,17 @@ class HtmlToMarkdownConverter:
         html_path = article_metadata['html_path']
         image_mapping = article_metadata.get('images', {})
         
-        # 读取HTML内容
-        with open(html_path, 'r', encoding='utf-8') as f:
-            full_html = f.read()
+        # 读取HTML内容（压缩文件自动解压）
+        full_html = RawStore.load(html_path)
         
-        # 清理HTML
-        cleaned_html = self.clean_html(full_html)
+        # 清理HTML，得到正文元素
+        content = self.clean_html(full_html)
         
         # 处理图片链接
-        processed_html = self.process_images(cleaned_html, image_mapping)
+        content = self.process_images(content, image_mapping)
         
         # 转换为Markdown
-        markdown_content = self.html_to_markdown(processed_html, title)
+        markdown_content = self.html_to_markdown(content, title)
         
         # 保存Markdown文件
         markdown_filename = f"{article_id}.md"
@@ -106,44 +351,206 @@ class HtmlToMarkdownConverter:
         
         print(f"已转换: {title} -> {markdown_filename}")
         
+        # 趁Markdown还在内存中生成摘要，后续步骤不必再读全文
+        digest = make_digest(article_id, title, markdown_content, str(markdown_filepath),
+                             image_count=sum(1 for _ in content.iter('img')),
+                             excerpt_chars=self.excerpt_chars)
+        
         return {
             'id': article_id,
             'title': title,
             'markdown_path': str(markdown_filepath),
-            'image_mapping': image_mapping
+            'image_mapping': image_mapping,
+            'digest': digest
         }
     
-    def convert_all_articles(self):
-        """转换所有文章"""
-        # 读取索引文件
-        index_path = self.raw_articles_path / "index.json"
+    def convert_serial(self, articles):
+        """在当前进程中逐篇转换，按顺序返回 (文章元数据, 结果, 错误)"""
+        for article in articles:
+            try:
+                yield article, self.convert_article(article), None
+            except Exception as e:
+                yield article, None, str(e)
+    
+    def convert_parallel(self, articles, workers):
+        """在进程池中转换，按输入顺序返回 (文章元数据, 结果, 错误)
         
-        if not index_path.exists():
+        最多同时提交 workers*4 篇，索引很大时也不会一次性读入所有文章
+        """
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(self.config_path,)) as executor:
+            pending = deque()
+            for article in articles:
+                pending.append((article, executor.submit(convert_in_worker, article)))
+                if len(pending) >= workers * 4:
+                    article, future = pending.popleft()
+                    yield (article,) + future.result()
+            while pending:
+                article, future = pending.popleft()
+                yield (article,) + future.result()
+    
+    def load_manifest(self):
+        """读取转换清单：文章ID -> 源文件哈希、图片映射哈希、转换器版本、渲染器、摘要设置、输出路径和摘要"""
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except json.JSONDecodeError:
+                print("转换清单已损坏，将全部重新转换")
+        return {}
+    
+    def save_manifest(self, manifest):
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def fingerprint(self, article, entry=None):
+        """文章的转换依据，源文件不存在时返回None
+        
+        源文件大小和修改时间与清单一致时直接沿用清单中的哈希，不重新读取文件
+        """
+        try:
+            stat = os.stat(article['html_path'])
+        except (OSError, KeyError):
+            return None
+        
+        if entry and entry.get('source_size') == stat.st_size and entry.get('source_mtime') == stat.st_mtime_ns:
+            source_hash = entry['source_hash']
+        else:
+            source_hash = ImageStore.file_digest(article['html_path'])
+        
+        images = json.dumps(article.get('images', {}), ensure_ascii=False, sort_keys=True)
+        return {
+            'source_hash': source_hash,
+            'source_size': stat.st_size,
+            'source_mtime': stat.st_mtime_ns,
+            'images_hash': hashlib.sha256(images.encode('utf-8')).hexdigest(),
+            'converter_version': CONVERTER_VERSION,
+            'renderer': self.renderer,
+            # 摘要设置变化时重新生成摘要
+            'digest_settings': {'version': DIGEST_VERSION, 'excerpt_chars': self.excerpt_chars},
+        }
+    
+    def is_current(self, entry, fingerprint):
+        """清单记录与当前源文件、图片映射、转换器版本、渲染器和摘要设置一致，且输出文件仍在"""
+        if not entry or not fingerprint:
+            return False
+        for key in ('source_hash', 'images_hash', 'converter_version', 'renderer', 'digest_settings'):
+            if entry.get(key) != fingerprint[key]:
+                return False
+        return Path(entry['markdown_path']).exists()
+    
+    def convert_all_articles(self, workers=None, force=False):
+        """增量转换所有文章：跳过未变化的文章，删除已移出索引的文章的Markdown
+        
+        workers大于1时使用进程池并行转换，单篇失败不影响其他文章；force为True时全部重新转换
+        """
+        # 读取索引文件，逐篇读取，不整体加载
+        articles = ArticleIndex(self.raw_articles_path)
+        
+        if not articles.exists():
             print("未找到文章索引文件，请先运行爬虫")
             return []
         
-        with open(index_path, 'r', encoding='utf-8') as f:
-            articles = json.load(f)
+        workers = workers or self.workers or 1
+        manifest = self.load_manifest()
+        order = []
+        results = {}
+        digests = {}
+        fingerprints = {}
+        failures = []
+        skipped = 0
         
-        results = []
+        print(f"开始转换 {len(articles)} 篇文章..." + (f"（{workers} 个进程）" if workers > 1 else ""))
         
-        print(f"开始转换 {len(articles)} 篇文章...")
+        def stale_articles():
+            """按索引顺序过滤出需要转换的文章"""
+            nonlocal skipped
+            for article in articles:
+                article_id = article['id']
+                order.append(article_id)
+                entry = manifest.get(article_id)
+                fingerprint = self.fingerprint(article, entry)
+                if not force and self.is_current(entry, fingerprint):
+                    results[article_id] = {
+                        'id': article_id,
+                        'title': article['title'],
+                        'markdown_path': entry['markdown_path'],
+                        'image_mapping': article.get('images', {})
+                    }
+                    digests[article_id] = entry['digest']
+                    skipped += 1
+                    continue
+                fingerprints[article_id] = fingerprint
+                yield article
         
-        for article in articles:
-            try:
-                result = self.convert_article(article)
-                results.append(result)
-            except Exception as e:
-                print(f"转换失败: {article['title']} - {e}")
+        try:
+            converted = (self.convert_parallel(stale_articles(), workers) if workers > 1
+                         else self.convert_serial(stale_articles()))
+            for article, result, error in converted:
+                fingerprint = fingerprints.pop(article['id'], None)
+                if error is None:
+                    digests[article['id']] = result.pop('digest')
+                    results[article['id']] = result
+                    if fingerprint:
+                        manifest[article['id']] = dict(fingerprint, markdown_path=result['markdown_path'],
+                                                       digest=digests[article['id']])
+                else:
+                    print(f"转换失败: {article.get('title', article.get('id'))} - {error}")
+                    failures.append((article, error))
+                    # 删除旧的清单记录和Markdown，下次运行时重新转换
+                    stale = manifest.pop(article['id'], None)
+                    if stale:
+                        Path(stale['markdown_path']).unlink(missing_ok=True)
+            
+            # 删除已不在索引中的文章
+            current_ids = set(order)
+            removed = [article_id for article_id in manifest if article_id not in current_ids]
+            for article_id in removed:
+                Path(manifest.pop(article_id)['markdown_path']).unlink(missing_ok=True)
+        finally:
+            # 中断时也保存已完成部分，下次从这里继续
+            self.save_manifest(manifest)
         
         # 保存转换结果索引
+        results = [results[article_id] for article_id in order if article_id in results]
         converted_index_path = self.markdown_path / "index.json"
         with open(converted_index_path, 'w', encoding='utf-8') as f:
             json.dump(results, f, ensure_ascii=False, indent=2)
         
-        print(f"\n转换完成！共转换 {len(results)} 篇文章")
+        # 保存文章摘要（digests.json），分类等步骤只读摘要；启用去重时同时标记重复文章
+        digest_list = [digests[article['id']] for article in results]
+        deduplicator = Deduplicator.from_config(self.config)
+        if deduplicator:
+            deduplicator.run(digest_list)
+        else:
+            save_digests(self.markdown_path, digest_list)
+        
+        print(f"\n转换完成！共 {len(results)} 篇文章，本次转换 {len(results) - skipped} 篇，"
+              f"跳过未变化的 {skipped} 篇")
+        if removed:
+            print(f"已删除 {len(removed)} 篇移出索引的文章的Markdown")
+        if failures:
+            print(f"转换失败 {len(failures)} 篇:")
+            for article, error in failures:
+                print(f"  - {article.get('id')} {article.get('title', '')}: {error}")
         return results
 
+# 进程池中每个进程各自持有一个转换器
+worker_converter = None
+
+def init_worker(config_path):
+    global worker_converter
+    worker_converter = HtmlToMarkdownConverter(config_path)
+
+def convert_in_worker(article):
+    """在子进程中转换单篇文章，返回 (结果, 错误)，异常不会中断整批转换"""
+    try:
+        return worker_converter.convert_article(article), None
+    except Exception as e:
+        return None, str(e)
+
 if __name__ == "__main__":
     # 测试转换器
     converter = HtmlToMarkdownConverter()
@@ -0,0 +1,164 @@
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+def normalize_url(url):
+    """规范化URL"""
+    # 处理短链接
+    if 'mp.weixin.qq.com/s/' in url:
+        # 移除多余参数
+        if '?' in url:
+            base_url = url.split('?')[0]
+            params = parse_qs(urlparse(url).query)
+            # 保留必要参数
+            essential_params = ['__biz', 'mid', 'idx', 'sn']
+            new_params = []
+            for param in essential_params:
+                if param in params:
+                    new_params.append(f"{param}={params[param][0]}")
+            if new_params:
+                url = base_url + '?' + '&'.join(new_params)
+        return url
+    return url
+
+class CrawlJournal:
+    """爬取日志：以规范化URL为键，记录稳定的文章ID和每个URL的状态，每篇文章完成后立即提交"""
+    
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    def __init__(self, db_path, retry_backoff=300, max_attempts=5):
+        # 失败后第n次重试前至少等待 retry_backoff * 2^(n-1) 秒
+        self.retry_backoff = retry_backoff
+        self.max_attempts = max_attempts
+        
+        self.db = sqlite3.connect(str(db_path))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS urls (
+                url_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                article_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_retry_at REAL,
+                last_error TEXT,
+                metadata TEXT,
+                updated_at REAL
+            )
+        ''')
+        self.db.commit()
+    
+    @classmethod
+    def from_config(cls, config):
+        """日志文件保存在 raw_articles 目录下"""
+        system_config = config.get('system', {})
+        db_path = Path(config['paths']['raw_articles']) / "crawl_journal.db"
+        return cls(
+            db_path,
+            retry_backoff=system_config.get('retry_backoff_seconds', 300),
+            max_attempts=system_config.get('max_crawl_attempts', 5)
+        )
+    
+    def close(self):
+        self.db.close()
+    
+    @staticmethod
+    def article_id_for(url_key):
+        """由规范化URL得到的稳定文章ID，重复爬取同一URL总是得到同一个ID"""
+        return "article_" + hashlib.sha1(url_key.encode('utf-8')).hexdigest()[:12]
+    
+    def get(self, url_key):
+        return self.db.execute('SELECT * FROM urls WHERE url_key = ?', (url_key,)).fetchone()
+    
+    def plan(self, urls, force=False):
+        """把URL分为待爬取、已完成、暂缓重试和已放弃四类
+        
+        返回字典，todo 中每项为 (url, url_key, article_id)，其余为URL列表。
+        force 为True时已完成和已放弃的URL也重新爬取。
+        """
+        plan = {'todo': [], 'done': [], 'deferred': [], 'given_up': []}
+        seen = set()
+        now = time.time()
+        
+        for url in urls:
+            url_key = normalize_url(url)
+            if url_key in seen:
+                # 同一批次中的重复链接只处理一次
+                continue
+            seen.add(url_key)
+            
+            row = self.get(url_key)
+            if row is not None and not force:
+                if row['state'] == self.DONE:
+                    plan['done'].append(url)
+                    continue
+                if row['state'] == self.FAILED:
+                    if row['attempts'] >= self.max_attempts:
+                        plan['given_up'].append(url)
+                        continue
+                    if row['next_retry_at'] and row['next_retry_at'] > now:
+                        plan['deferred'].append(url)
+                        continue
+            
+            plan['todo'].append((url, url_key, self.article_id_for(url_key)))
+        
+        return plan
+    
+    def mark_pending(self, url_key, url, article_id):
+        """开始处理，中断后仍为pending的URL下次会重新爬取"""
+        self.db.execute('''
+            INSERT INTO urls (url_key, url, article_id, state, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url_key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+        ''', (url_key, url, article_id, self.PENDING, time.time()))
+        self.db.commit()
+    
+    def mark_done(self, url_key, metadata):
+        self.db.execute('''
+            UPDATE urls SET state = ?, metadata = ?, last_error = NULL, next_retry_at = NULL, updated_at = ?
+            WHERE url_key = ?
+        ''', (self.DONE, json.dumps(metadata, ensure_ascii=False), time.time(), url_key))
+        self.db.commit()
+    
+    def mark_failed(self, url_key, error):
+        """记录失败，按尝试次数指数退避安排下次重试"""
+        row = self.get(url_key)
+        attempts = (row['attempts'] if row else 0) + 1
+        next_retry_at = time.time() + self.retry_backoff * 2 ** (attempts - 1)
+        self.db.execute('''
+            UPDATE urls SET state = ?, attempts = ?, next_retry_at = ?, last_error = ?, updated_at = ?
+            WHERE url_key = ?
+        ''', (self.FAILED, attempts, next_retry_at, str(error), time.time(), url_key))
+        self.db.commit()
+    
+    def is_done(self, url_key):
+        row = self.get(url_key)
+        return row is not None and row['state'] == self.DONE
+    
+    def iter_done(self):
+        """按完成时间顺序返回所有已完成文章的元数据"""
+        rows = self.db.execute(
+            'SELECT metadata FROM urls WHERE state = ? AND metadata IS NOT NULL ORDER BY updated_at',
+            (self.DONE,)
+        )
+        for row in rows:
+            yield json.loads(row['metadata'])
+    
+    def collect(self, urls):
+        """按输入顺序返回已完成URL的元数据"""
+        results = []
+        seen = set()
+        for url in urls:
+            url_key = normalize_url(url)
+            if url_key in seen:
+                continue
+            seen.add(url_key)
+            row = self.get(url_key)
+            if row is not None and row['state'] == self.DONE and row['metadata']:
+                results.append(json.loads(row['metadata']))
+        return results
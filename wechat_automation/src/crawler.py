@@ -1,12 +1,18 @@
 import os
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
-import requests
 from tqdm import tqdm
 from pathlib import Path
 import json
 import yaml
+import hashlib
+
+from image_store import ImageStore
+from raw_store import RawStore
+from article_index import ArticleIndex
+from crawl_journal import CrawlJournal
+from parse_pool import ParsePool
+from fetcher import AsyncFetcher, gather_bounded
 
 class WechatCrawler:
     """微信公众号文章爬虫"""
@@ -19,75 +25,50 @@ class WechatCrawler:
         self.images_path = Path(self.config['paths']['images'])
         self.raw_articles_path.mkdir(parents=True, exist_ok=True)
         self.images_path.mkdir(parents=True, exist_ok=True)
+        
+        # 按内容去重的图片库，文章目录中只保留链接
+        self.image_store = ImageStore(self.images_path)
+        
+        # 爬取日志：稳定的文章ID、断点续爬和失败重试
+        self.journal = CrawlJournal.from_config(self.config)
+        
+        # 只追加的文章索引，合并历次爬取的结果
+        self.article_index = ArticleIndex(self.raw_articles_path)
+        if not self.article_index.path.exists():
+            # 首次使用时从爬取日志导入此前完成的文章
+            for metadata in self.journal.iter_done():
+                self.article_index.append(metadata)
+        
+        # 原始文章存储（压缩的正文区域，可选保留完整页面）
+        self.raw_store = RawStore.from_config(self.config)
+        
+        # HTML解析进程池，爬取时打开
+        self.parse_pool = ParsePool.from_config(self.config)
+        
+        # 同时在途的文章数
+        self.max_concurrent = self.config.get('system', {}).get('max_concurrent_requests', 5)
+        
+        # 单篇文章内同时下载的图片数
+        self.max_concurrent_images = self.config.get('system', {}).get('max_concurrent_images', 8)
+        
+        # 添加请求头，模拟浏览器
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
     
-    def extract_content(self, url):
+    async def extract_content(self, fetcher, url):
         """从URL提取文章内容"""
         try:
             print(f"[DEBUG] 开始提取: {url}")
             
-            # 添加请求头，模拟浏览器
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            status, response_text, _ = await fetcher.fetch_text(url)
             
-            response = requests.get(url, headers=headers, timeout=30)
-            response.encoding = 'utf-8'
+            print(f"[DEBUG] 响应状态码: {status}")
             
-            print(f"[DEBUG] 响应状态码: {response.status_code}")
-            
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # 提取标题 - 尝试多种选择器
-                title = soup.find('h1', class_='rich_media_title')
-                if not title:
-                    title = soup.find('h2', class_='rich_media_title')
-                if not title:
-                    title = soup.find('meta', attrs={'property': 'og:title'})
-                    if title:
-                        title_text = title.get('content', '未知标题')
-                    else:
-                        title_text = "未知标题"
-                else:
-                    title_text = title.get_text(strip=True)
-                
-                print(f"[DEBUG] 提取到标题: {title_text}")
-                
-                # 提取内容 - 尝试多种选择器
-                content_div = soup.find('div', class_='rich_media_content')
-                if not content_div:
-                    content_div = soup.find('div', id='js_content')
-                if not content_div:
-                    content_div = soup.find('div', class_='rich_media_area_primary')
-                
-                if content_div:
-                    print(f"[DEBUG] 找到内容区域，长度: {len(str(content_div))}")
-                    return {
-                        'title': title_text,
-                        'url': url,
-                        'html': str(content_div),
-                        'full_html': response.text
-                    }
-                else:
-                    print(f"[DEBUG] 未找到内容区域，尝试保存完整响应")
-                    # 保存响应以便调试
-                    debug_path = self.raw_articles_path / f"debug_{hash(url)}.html"
-                    with open(debug_path, 'w', encoding='utf-8') as f:
-                        f.write(response.text)
-                    print(f"[DEBUG] 调试文件已保存到: {debug_path}")
-                    
-                    # 返回整个body作为后备方案
-                    body = soup.find('body')
-                    if body:
-                        return {
-                            'title': title_text,
-                            'url': url,
-                            'html': str(body),
-                            'full_html': response.text
-                        }
-                    return None
+            if status == 200:
+                return await self.parse_content(response_text, url)
             else:
-                print(f"[ERROR] 获取失败，状态码: {response.status_code}")
+                print(f"[ERROR] 获取失败，状态码: {status}")
                 return None
                 
         except Exception as e:
@@ -96,28 +77,50 @@ class WechatCrawler:
             print(f"[DEBUG] 错误详情:\n{traceback.format_exc()}")
             return None
     
-    def download_images(self, html_content, article_id):
-        """下载文章中的图片"""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        images = soup.find_all('img')
+    async def parse_content(self, response_text, url):
+        """从页面HTML中解析标题、正文和图片地址（lxml只解析一次，在解析进程池中执行）"""
+        parsed = await self.parse_pool.parse(response_text, 'basic')
+        if parsed is None:
+            print(f"[DEBUG] 页面内容为空")
+            return None
+        
+        title_text = parsed['title']
+        print(f"[DEBUG] 提取到标题: {title_text}")
+        
+        if parsed['selector'] is None:
+            print(f"[DEBUG] 未找到内容区域，尝试保存完整响应")
+            # 保存响应以便调试
+            debug_path = self.raw_store.save_debug(hash(url), response_text)
+            if debug_path:
+                print(f"[DEBUG] 调试文件已保存到: {debug_path}")
+            
+            # 返回整个body作为后备方案
+            if not parsed['html']:
+                return None
         
+        content_html = parsed['html']
+        print(f"[DEBUG] 找到内容区域，长度: {len(content_html)}")
+        return {
+            'title': title_text,
+            'url': url,
+            'html': content_html,
+            'images': parsed['images'],
+            'full_html': response_text
+        }
+    
+    async def download_images(self, fetcher, images, article_id):
+        """并发下载文章中的图片，最多同时下载 max_concurrent_images 张
+        
+        images 为 parse_content 得到的图片地址列表，不再重新解析HTML
+        """
         print(f"[DEBUG] 找到 {len(images)} 张图片")
         
         article_images_path = self.images_path / article_id
         article_images_path.mkdir(exist_ok=True)
         
-        image_mapping = {}
-        downloaded_count = 0
+        downloads = []
         
-        for idx, img in enumerate(images):
-            img_url = None
-            
-            # 尝试不同的属性获取图片URL
-            for attr in ['data-src', 'src', 'data-original']:
-                if img.get(attr):
-                    img_url = img.get(attr)
-                    break
-            
+        for idx, img_url in enumerate(images):
             if img_url:
                 # 处理相对URL
                 if not img_url.startswith('http'):
@@ -127,117 +130,202 @@ class WechatCrawler:
                         print(f"[DEBUG] 跳过相对URL: {img_url}")
                         continue
                 
-                try:
-                    print(f"[DEBUG] 下载图片 {idx+1}: {img_url[:50]}...")
-                    
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                        'Referer': 'https://mp.weixin.qq.com/'
-                    }
-                    
-                    response = requests.get(img_url, headers=headers, timeout=30)
-                    if response.status_code == 200:
-                        # 确定图片格式
-                        content_type = response.headers.get('content-type', '')
-                        if 'jpeg' in content_type or 'jpg' in content_type:
-                            ext = '.jpg'
-                        elif 'png' in content_type:
-                            ext = '.png'
-                        elif 'gif' in content_type:
-                            ext = '.gif'
-                        else:
-                            ext = '.jpg'  # 默认
-                        
-                        filename = f"image_{idx+1}{ext}"
-                        filepath = article_images_path / filename
-                        
-                        with open(filepath, 'wb') as f:
-                            f.write(response.content)
-                        
-                        image_mapping[img_url] = str(filepath)
-                        downloaded_count += 1
-                        print(f"[SUCCESS] 下载图片: {filename}")
-                    else:
-                        print(f"[ERROR] 图片下载失败，状态码: {response.status_code}")
-                        
-                except Exception as e:
-                    print(f"[ERROR] 下载图片失败: {e}")
+                downloads.append(self.download_image(fetcher, img_url, idx, article_images_path))
+        
+        filepaths = await gather_bounded(downloads, self.max_concurrent_images)
+        
+        image_mapping = {img_url: filepath for img_url, filepath in filepaths if filepath}
         
-        print(f"[DEBUG] 共下载 {downloaded_count} 张图片")
+        print(f"[DEBUG] 共下载 {len(image_mapping)} 张图片")
         return image_mapping
     
-    async def crawl_articles(self, urls):
-        """批量爬取文章"""
-        results = []
-        failed_urls = []
+    async def download_image(self, fetcher, img_url, idx, article_images_path):
+        """流式下载单张图片，返回 (图片URL, 本地路径)，失败时路径为None"""
+        downloading = False
+        try:
+            # 之前下载过的URL直接链接到库中的文件（录制时仍然下载，保证录制完整）
+            blob = None if fetcher.recording else self.image_store.lookup(img_url)
+            pending = None if fetcher.recording or blob else self.image_store.pending_download(img_url)
+            if pending is not None:
+                # 其他文章正在下载同一张图片，等待那次下载的结果
+                blob = await asyncio.shield(pending)
+                if blob is None:
+                    print(f"[ERROR] 图片下载失败（同一图片的下载未成功）: {img_url[:80]}")
+                    return img_url, None
+            if blob:
+                filepath = self.image_store.link(blob, article_images_path / f"image_{idx+1}{blob.suffix}")
+                print(f"[DEBUG] 复用已下载图片: {filepath.name}")
+                return img_url, str(filepath)
+            
+            print(f"[DEBUG] 下载图片 {idx+1}: {img_url[:50]}...")
+            
+            headers = {'Referer': 'https://mp.weixin.qq.com/'}
+            
+            if not fetcher.recording:
+                self.image_store.start_download(img_url)
+                downloading = True
+            part_path = self.image_store.temp_path()
+            status, content_type, size, digest = await fetcher.download_to_file(
+                img_url, part_path, headers=headers, hasher=hashlib.sha256
+            )
+            if status == 200:
+                # 确定图片格式
+                if 'jpeg' in content_type or 'jpg' in content_type:
+                    ext = '.jpg'
+                elif 'png' in content_type:
+                    ext = '.png'
+                elif 'gif' in content_type:
+                    ext = '.gif'
+                else:
+                    ext = '.jpg'  # 默认
+                
+                filename = f"image_{idx+1}{ext}"
+                blob = self.image_store.add(img_url, part_path, digest, ext, size)
+                filepath = self.image_store.link(blob, article_images_path / filename)
+                
+                print(f"[SUCCESS] 下载图片: {filename}")
+                return img_url, str(filepath)
+            else:
+                print(f"[ERROR] 图片下载失败，状态码: {status}")
+                
+        except Exception as e:
+            print(f"[ERROR] 下载图片失败: {e}")
+        finally:
+            if downloading:
+                self.image_store.finish_download(img_url, blob)
+        
+        return img_url, None
+    
+    async def crawl_article(self, fetcher, page_slots, image_slots, idx, total, url, url_key, article_id):
+        """爬取单篇文章，成功返回元数据，失败返回None，结果立即写入爬取日志
         
-        print(f"[DEBUG] 开始爬取 {len(urls)} 篇文章")
+        页面抓取和图片下载分别占用 page_slots 和 image_slots，
+        本篇下载图片时，下一篇的页面抓取可以同时进行
+        """
+        print(f"\n{'='*60}")
+        print(f"[INFO] 处理第 {idx+1}/{total} 篇: {url}")
         
-        for idx, url in enumerate(tqdm(urls, desc="爬取文章")):
-            print(f"\n{'='*60}")
-            print(f"[INFO] 处理第 {idx+1}/{len(urls)} 篇: {url}")
+        self.journal.mark_pending(url_key, url, article_id)
+        
+        try:
+            # 提取内容
+            async with page_slots:
+                content = await self.extract_content(fetcher, url)
             
-            try:
-                # 提取内容
-                content = self.extract_content(url)
+            if content:
+                # 文章ID由规范化URL生成，重复爬取不会产生新文章
+                print(f"[DEBUG] 文章ID: {article_id}")
                 
-                if content:
-                    # 生成文章ID
-                    article_id = f"article_{idx+1}"
-                    print(f"[DEBUG] 文章ID: {article_id}")
-                    
-                    # 下载图片
-                    print(f"[INFO] 开始下载图片...")
-                    image_mapping = self.download_images(content['html'], article_id)
-                    
-                    # 保存原始HTML
-                    html_path = self.raw_articles_path / f"{article_id}.html"
-                    with open(html_path, 'w', encoding='utf-8') as f:
-                        f.write(content['full_html'])
-                    print(f"[SUCCESS] HTML已保存: {html_path}")
-                    
-                    # 保存元数据
-                    metadata = {
-                        'id': article_id,
-                        'title': content['title'],
-                        'url': content['url'],
-                        'images': image_mapping,
-                        'html_path': str(html_path)
-                    }
-                    
-                    results.append(metadata)
-                    
-                    # 保存元数据
-                    metadata_path = self.raw_articles_path / f"{article_id}_metadata.json"
-                    with open(metadata_path, 'w', encoding='utf-8') as f:
-                        json.dump(metadata, f, ensure_ascii=False, indent=2)
-                    print(f"[SUCCESS] 元数据已保存: {metadata_path}")
-                    
-                    print(f"[SUCCESS] 文章处理完成: {content['title']}")
-                else:
-                    print(f"[ERROR] 无法提取内容: {url}")
-                    failed_urls.append(url)
+                # 下载图片
+                print(f"[INFO] 开始下载图片...")
+                async with image_slots:
+                    image_mapping = await self.download_images(fetcher, content['images'], article_id)
+                
+                # 保存HTML（默认只保存压缩后的正文区域）
+                html_path, size = self.raw_store.save(
+                    article_id, content['title'], content['html'], content['full_html']
+                )
+                print(f"[SUCCESS] HTML已保存: {html_path} ({size / 1024:.1f} KB，"
+                      f"原页面 {len(content['full_html'].encode('utf-8')) / 1024:.1f} KB)")
                 
-            except Exception as e:
-                print(f"[ERROR] 处理文章时出错: {e}")
-                import traceback
-                print(f"[DEBUG] 错误详情:\n{traceback.format_exc()}")
-                failed_urls.append(url)
+                # 保存元数据
+                metadata = {
+                    'id': article_id,
+                    'title': content['title'],
+                    'url': content['url'],
+                    'images': image_mapping,
+                    'html_path': str(html_path)
+                }
+                
+                # 保存元数据
+                metadata_path = self.raw_articles_path / f"{article_id}_metadata.json"
+                with open(metadata_path, 'w', encoding='utf-8') as f:
+                    json.dump(metadata, f, ensure_ascii=False, indent=2)
+                print(f"[SUCCESS] 元数据已保存: {metadata_path}")
+                
+                self.journal.mark_done(url_key, metadata)
+                self.article_index.append(metadata)
+                
+                print(f"[SUCCESS] 文章处理完成: {content['title']}")
+                return metadata
+            else:
+                print(f"[ERROR] 无法提取内容: {url}")
+                self.journal.mark_failed(url_key, "无法提取内容")
+                return None
             
-            # 避免请求过快
-            await asyncio.sleep(1)
+        except Exception as e:
+            print(f"[ERROR] 处理文章时出错: {e}")
+            import traceback
+            print(f"[DEBUG] 错误详情:\n{traceback.format_exc()}")
+            self.journal.mark_failed(url_key, e)
+            return None
+    
+    async def crawl_articles(self, urls, force=False):
+        """批量爬取文章，最多同时处理 max_concurrent_requests 篇
+        
+        已完成的URL直接跳过，失败的URL在退避时间过后的运行中重试；
+        force为True时全部重新爬取。返回本批URL中所有已完成文章的元数据
+        """
+        removed = self.raw_store.cleanup_debug()
+        if removed:
+            print(f"[INFO] 已清理 {removed} 个过期的调试文件")
+        
+        plan = self.journal.plan(urls, force=force)
+        todo = plan['todo']
+        
+        print(f"[DEBUG] 开始爬取 {len(todo)} 篇文章（并发数: {self.max_concurrent}）")
+        if plan['done']:
+            print(f"[INFO] 跳过已完成的 {len(plan['done'])} 篇")
+        if plan['deferred']:
+            print(f"[INFO] {len(plan['deferred'])} 篇此前失败的文章未到重试时间，本次跳过")
+        if plan['given_up']:
+            print(f"[INFO] {len(plan['given_up'])} 篇文章已超过最大尝试次数，使用 --force 可强制重试")
         
-        # 保存总的索引文件
-        if results:
-            index_path = self.raw_articles_path / "index.json"
-            with open(index_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
-            print(f"[SUCCESS] 索引文件已保存: {index_path}")
+        # 页面阶段和图片阶段各自最多 max_concurrent_requests 篇，流水线执行
+        page_slots = asyncio.Semaphore(self.max_concurrent)
+        image_slots = asyncio.Semaphore(self.max_concurrent)
+        
+        rates, cache_summary, cassette_summary = {}, None, None
+        try:
+            async with self.parse_pool, AsyncFetcher(self.config, self.headers) as fetcher:
+                try:
+                    with tqdm(total=len(todo), desc="爬取文章") as progress:
+                        await gather_bounded(
+                            [self.crawl_article(fetcher, page_slots, image_slots, idx, len(todo), url, url_key, article_id)
+                             for idx, (url, url_key, article_id) in enumerate(todo)],
+                            self.max_concurrent * 2,
+                            progress,
+                            postfix=fetcher.rate_limiter.summary
+                        )
+                finally:
+                    rates = fetcher.rate_limiter.get_rates()
+                    cache_summary = fetcher.cache.summary() if fetcher.cache is not None else None
+                    cassette_summary = fetcher.cassette.summary() if fetcher.cassette is not None else None
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            print(f"\n[WARNING] 爬取被中断，已完成的文章已记录，再次运行将从断点继续")
+            raise
+        
+        # 索引在每篇文章完成时已写入，这里只汇总本批结果
+        results = self.journal.collect(urls)
+        
+        failed_urls = [url for url, url_key, _ in todo if not self.journal.is_done(url_key)]
         
         print(f"\n{'='*60}")
         print(f"[SUMMARY] 爬取完成！")
         print(f"[SUMMARY] 成功: {len(results)} 篇")
         print(f"[SUMMARY] 失败: {len(failed_urls)} 篇")
+        print(f"[SUMMARY] 文章索引: {self.article_index.path}")
+        
+        # 各主机最终速率，便于调整 system.rate_limit
+        for host, stat in rates.items():
+            print(f"[SUMMARY] {host}: {stat['rate']} 次/秒，"
+                  f"请求 {stat['requests']} 次，被限流 {stat['throttled']} 次")
+        
+        if cache_summary:
+            print(f"[SUMMARY] HTTP缓存: {cache_summary}")
+        
+        if cassette_summary:
+            print(f"[SUMMARY] 录制回放: {cassette_summary}")
         
         if failed_urls:
             print(f"[SUMMARY] 失败的URL:")
@@ -6,6 +6,8 @@ import yaml
 from typing import List, Dict
 from datetime import datetime
 
+from token_budget import TokenBudget
+
 class ContentCreator:
     """AI创作助手，基于素材库创作文章"""
     
@@ -26,6 +28,9 @@ class ContentCreator:
         
         with open('config/prompts/polish.txt', 'r', encoding='utf-8') as f:
             self.polish_prompt_template = f.read()
+        
+        # 单次请求的输入token上限：素材超出时按维度截断，文章超出时分段优化
+        self.budget = TokenBudget.from_config(self.config)
     
     def load_theme_materials(self, theme_name: str) -> Dict:
         """加载主题的素材库"""
@@ -47,6 +52,34 @@ class ContentCreator:
         
         return materials
     
+    def create_prompt(self, theme_name: str, materials: Dict, custom_prompt: str = "") -> str:
+        """构建创作提示词，素材超出token上限时每个维度只保留前面的条目（素材按出现次数从多到少排列）"""
+        def build(material_content):
+            # 构建提示
+            if custom_prompt:
+                # 如果有自定义提示，添加到标准提示后
+                return self.create_prompt_template.format(
+                    theme_name=theme_name,
+                    material_content=material_content
+                ) + f"\n\n额外要求：{custom_prompt}"
+            return self.create_prompt_template.format(
+                theme_name=theme_name,
+                material_content=material_content
+            )
+        
+        # 每个维度的标题和分隔约占10个token
+        available = self.budget.limit('create') - self.budget.count(build("")) - 10 * len(materials)
+        fitted = self.budget.fit_sections(materials, available)
+        if fitted != materials:
+            print(f"素材超出创作的token上限，已按维度截断到约 {available} tokens")
+        
+        # 构建素材内容
+        material_content = "\n\n".join([
+            f"## {dimension}\n{content}"
+            for dimension, content in fitted.items()
+        ])
+        return build(material_content)
+    
     def create_article(self, theme_name: str, custom_prompt: str = "") -> str:
         """基于素材创作文章"""
         # 加载素材
@@ -56,25 +89,7 @@ class ContentCreator:
             return ""
         
         print(f"正在为主题 {theme_name} 创作文章...")
-        
-        # 构建素材内容
-        material_content = "\n\n".join([
-            f"## {dimension}\n{content}"
-            for dimension, content in materials.items()
-        ])
-        
-        # 构建提示
-        if custom_prompt:
-            # 如果有自定义提示，添加到标准提示后
-            full_prompt = self.create_prompt_template.format(
-                theme_name=theme_name,
-                material_content=material_content
-            ) + f"\n\n额外要求：{custom_prompt}"
-        else:
-            full_prompt = self.create_prompt_template.format(
-                theme_name=theme_name,
-                material_content=material_content
-            )
+        full_prompt = self.create_prompt(theme_name, materials, custom_prompt)
         
         # 调用Gemini创作
         try:
@@ -87,24 +102,66 @@ class ContentCreator:
             print(f"创作文章时出错: {e}")
             return ""
     
+    def polish_sections(self, article_content: str) -> List[tuple]:
+        """文章超出优化的token上限时分组，每组单独优化；返回 [(与前一组之间的分隔, 文字), ...]，通常只有一组
+        
+        单个段落超出上限时按换行或句末切成几段，全文每个字都会交给模型优化
+        """
+        limit = self.budget.limit('polish') - self.budget.count(self.polish_prompt_template.format(article_content=""))
+        # (与前一段之间的分隔, 文字)：段落之间是空行，同一段落切出的几段直接相连
+        pieces = [
+            ("\n\n" if position == 0 else "", piece)
+            for paragraph in article_content.split("\n\n")
+            for position, piece in enumerate(self.budget.split(paragraph, limit))
+        ]
+        groups = self.budget.pack(pieces, limit, cost=lambda piece: self.budget.count(piece[1]) + 1)
+        
+        sections = []
+        for group in groups:
+            text = group[0][1] + "".join(separator + piece for separator, piece in group[1:])
+            sections.append(("" if not sections else group[0][0], text))
+        return sections
+    
     def polish_article(self, article_content: str) -> str:
         """优化文章语言"""
-        print("正在优化文章语言...")
+        sections = self.polish_sections(article_content)
+        print("正在优化文章语言..." + (f"（文章较长，分为{len(sections)}段）" if len(sections) > 1 else ""))
+        
+        polished = ""
+        for separator, section in sections:
+            # 构建提示
+            prompt = self.polish_prompt_template.format(
+                article_content=section
+            )
+            
+            try:
+                response = self.model.generate_content(prompt)
+                # 同一段落切开优化的部分重新接在一起
+                polished += separator + (response.text.strip() if len(sections) > 1 else response.text)
+                
+            except Exception as e:
+                print(f"优化文章时出错: {e}")
+                return article_content
         
-        # 构建提示
-        prompt = self.polish_prompt_template.format(
-            article_content=article_content
-        )
+        return polished
+    
+    def plan_create(self, theme_name: str, count: int = 1, polish: bool = True):
+        """dry-run：报告创作 count 篇文章预计的模型调用次数、token数和耗时，不调用模型"""
+        materials = self.load_theme_materials(theme_name)
+        if not materials:
+            return
         
-        try:
-            response = self.model.generate_content(prompt)
-            polished_content = response.text
-            
-            return polished_content
-            
-        except Exception as e:
-            print(f"优化文章时出错: {e}")
-            return article_content
+        prompt = self.create_prompt(theme_name, materials)
+        # 优化的输入是尚未生成的初稿，按创作阶段的输出token数估算
+        polish_tokens = (self.budget.count(self.polish_prompt_template.format(article_content=""))
+                         + self.budget.output_tokens['create'])
+        for _ in range(count):
+            self.budget.record('create', prompt)
+            if polish:
+                self.budget.record_tokens('polish', polish_tokens)
+        
+        print(f"\n[dry-run] 为主题 {theme_name} 创作 {count} 篇文章预计的模型调用：")
+        print(self.budget.report())
     
     def save_draft(self, theme_name: str, article_content: str, draft_name: str = None):
         """保存草稿"""
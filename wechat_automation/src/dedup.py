@@ -0,0 +1,145 @@
+import json
+from pathlib import Path
+
+from text_digest import load_digests, save_digests
+
+class Deduplicator:
+    """基于SimHash的近似重复文章检测
+    
+    64位指纹分成 bands 段，任一段完全相同的文章才进入候选（局部敏感哈希，不必两两比较）。
+    汉明距离不超过 max_distance 且 bands > max_distance 时，重复文章至少有一段相同，不会漏检；
+    bands 留空时取能整除64且大于 max_distance 的最小段数。
+    每组重复文章保留正文最长的一篇（相同时取索引中靠前的），其余在摘要中标记 duplicate_of。
+    """
+    
+    def __init__(self, markdown_path, max_distance=3, bands=None, min_chars=200):
+        if bands is None:
+            bands = min_bands(max_distance)
+        if 64 % bands:
+            raise ValueError(f"bands 必须能整除64: {bands}")
+        if bands <= max_distance:
+            raise ValueError(f"bands（{bands}）必须大于 max_distance（{max_distance}），否则会漏检重复文章")
+        self.markdown_path = Path(markdown_path)
+        self.path = self.markdown_path / "duplicates.json"
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = 64 // bands
+        # 太短的文章（通知、转载声明等）指纹不可靠，不参与去重
+        self.min_chars = min_chars
+    
+    @classmethod
+    def from_config(cls, config):
+        """从 dedup 配置创建，未启用时返回None"""
+        dedup_config = config.get('dedup', {}) or {}
+        if not dedup_config.get('enabled', True):
+            return None
+        return cls(
+            config['paths']['markdown'],
+            max_distance=dedup_config.get('max_distance', 3),
+            bands=dedup_config.get('bands'),
+            min_chars=dedup_config.get('min_chars', 200)
+        )
+    
+    def candidate_pairs(self, fingerprints):
+        """按指纹分段建桶，返回至少有一段相同的文章对（下标）"""
+        mask = (1 << self.band_bits) - 1
+        pairs = set()
+        for band in range(self.bands):
+            buckets = {}
+            shift = band * self.band_bits
+            for i, fingerprint in enumerate(fingerprints):
+                if fingerprint is None:
+                    continue
+                buckets.setdefault(fingerprint >> shift & mask, []).append(i)
+            for members in buckets.values():
+                for a in range(len(members)):
+                    for b in range(a + 1, len(members)):
+                        pairs.add((members[a], members[b]))
+        return pairs
+    
+    def find_groups(self, digests):
+        """返回重复组列表：[(保留的下标, [(重复的下标, 汉明距离), ...]), ...]"""
+        fingerprints = [
+            int(digest['simhash'], 16) if digest.get('simhash') and digest.get('chars', 0) >= self.min_chars else None
+            for digest in digests
+        ]
+        
+        # 并查集合并相互重复的文章
+        parent = list(range(len(digests)))
+        
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        for a, b in self.candidate_pairs(fingerprints):
+            if bin(fingerprints[a] ^ fingerprints[b]).count('1') <= self.max_distance:
+                parent[find(a)] = find(b)
+        
+        groups = {}
+        for i in range(len(digests)):
+            groups.setdefault(find(i), []).append(i)
+        
+        result = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            canonical = max(members, key=lambda i: (digests[i].get('chars', 0), -i))
+            duplicates = [
+                (i, bin(fingerprints[i] ^ fingerprints[canonical]).count('1'))
+                for i in members if i != canonical
+            ]
+            result.append((canonical, duplicates))
+        return sorted(result)
+    
+    def mark(self, digests):
+        """返回标记了 duplicate_of 的新摘要列表和重复组记录"""
+        marked = [{key: value for key, value in digest.items() if key != 'duplicate_of'} for digest in digests]
+        records = []
+        for canonical, duplicates in self.find_groups(marked):
+            canonical_id = marked[canonical]['id']
+            for i, _ in duplicates:
+                marked[i]['duplicate_of'] = canonical_id
+            records.append({
+                'canonical': canonical_id,
+                'title': marked[canonical]['title'],
+                'duplicates': [
+                    {'id': marked[i]['id'], 'title': marked[i]['title'], 'distance': distance}
+                    for i, distance in duplicates
+                ]
+            })
+        return marked, records
+    
+    def run(self, digests=None):
+        """检测重复文章，更新 digests.json 并保存 duplicates.json，返回重复组记录"""
+        if digests is None:
+            digests = load_digests(self.markdown_path)
+            if digests is None:
+                print("未找到文章摘要（digests.json），请先运行 convert")
+                return []
+        
+        marked, records = self.mark(digests)
+        save_digests(self.markdown_path, marked)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        
+        duplicate_count = sum(len(record['duplicates']) for record in records)
+        print(f"去重完成：{len(digests)} 篇文章中发现 {len(records)} 组重复，"
+              f"共 {duplicate_count} 篇重复文章将在后续步骤中跳过")
+        for record in records:
+            print(f"  - 保留 {record['canonical']} {record['title']}，"
+                  f"重复 {', '.join(item['id'] for item in record['duplicates'])}")
+        return records
+
+def min_bands(max_distance):
+    """能整除64且大于 max_distance 的最小段数"""
+    for bands in (1, 2, 4, 8, 16, 32, 64):
+        if bands > max_distance:
+            return bands
+    raise ValueError(f"max_distance 必须小于64: {max_distance}")
+
+def load_duplicate_ids(markdown_path):
+    """已标记为重复的文章ID集合，没有摘要文件时为空"""
+    digests = load_digests(markdown_path) or []
+    return {digest['id'] for digest in digests if digest.get('duplicate_of')}
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+class ExtractCache:
+    """逐篇素材提取结果的磁盘缓存
+    
+    键为 文章内容哈希 + 提示词模板哈希 + 模型名 + 主题名（提示词中包含主题名），
+    文章、提示词或模型任一变化都会重新提取。每篇提取完成后立即写入，中断后重跑不会重复调用模型。
+    """
+    
+    def __init__(self, cache_path, prompt_template, model_name):
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.prompt_hash = hashlib.sha256(prompt_template.encode('utf-8')).hexdigest()
+        self.model_name = model_name
+        self.stats = {'hits': 0, 'misses': 0}
+    
+    @classmethod
+    def from_config(cls, config, prompt_template):
+        """从配置创建，extract.cache 为false时返回None"""
+        extract_config = config.get('extract', {}) or {}
+        if not extract_config.get('cache', True):
+            return None
+        cache_path = config.get('paths', {}).get('extract_cache', 'data/extract_cache')
+        return cls(cache_path, prompt_template, config['gemini']['model'])
+    
+    def key(self, content, theme_name):
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return hashlib.sha256(
+            f"{content_hash}\n{self.prompt_hash}\n{self.model_name}\n{theme_name}".encode('utf-8')
+        ).hexdigest()
+    
+    def entry_path(self, key):
+        return self.cache_path / key[:2] / f"{key}.json"
+    
+    def get(self, key):
+        """返回缓存的素材，没有时返回None"""
+        path = self.entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                materials = json.load(f)['materials']
+        except (OSError, ValueError, KeyError):
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return materials
+    
+    def put(self, key, materials, source=None):
+        """写入一篇文章的提取结果（先写临时文件再替换，中断时不会留下损坏的条目）"""
+        path = self.entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'materials': materials,
+                'source': source,
+                'model': self.model_name,
+                'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def summary(self):
+        return f"缓存命中 {self.stats['hits']} 篇，调用模型 {self.stats['misses']} 篇"
@@ -1,10 +1,15 @@
 import os
+import re
 import json
+import asyncio
 from pathlib import Path
 import google.generativeai as genai
 import yaml
 from typing import List, Dict
 
+from extract_cache import ExtractCache
+from token_budget import TokenBudget
+
 class MaterialExtractor:
     """素材提取器，提取文章的12个维度信息"""
     
@@ -22,6 +27,29 @@ class MaterialExtractor:
         # 加载提示词
         with open('config/prompts/extract.txt', 'r', encoding='utf-8') as f:
             self.extract_prompt_template = f.read()
+        with open('config/prompts/extract_article.txt', 'r', encoding='utf-8') as f:
+            self.article_prompt_template = f.read()
+        
+        # article: 逐篇提取后在本地合并；theme: 整个主题的文章放进一个提示词（旧版方式）
+        extract_config = self.config.get('extract', {}) or {}
+        self.mode = extract_config.get('mode', 'article')
+        self.max_concurrency = extract_config.get('max_concurrency', 4)
+        self.retries = extract_config.get('retries', 2)
+        # 合并时相似度（字符二元组Jaccard）达到该值的素材视为重复
+        self.similarity = extract_config.get('similarity', 0.8)
+        # 每个维度最多保留的条数，0表示不限
+        self.max_items = extract_config.get('max_items_per_dimension', 0)
+        
+        # 逐篇提取结果缓存，文章和提示词未变化时不再调用模型
+        self.cache = ExtractCache.from_config(self.config, self.article_prompt_template)
+        
+        # 单次请求的输入token上限：逐篇提取时截断过长的文章，整主题提取时按预算分组
+        self.budget = TokenBudget.from_config(self.config)
+        
+        # 同时处理的主题数
+        self.theme_concurrency = extract_config.get('theme_concurrency', 3)
+        # 主题名 -> {'status', 'done', 'total'}，extract_all_themes 运行时用于显示进度
+        self.progress = {}
         
         # 12个维度
         self.dimensions = [
@@ -41,6 +69,17 @@ class MaterialExtractor:
     
     def extract_materials_for_theme(self, theme_name: str) -> Dict:
         """为特定主题提取素材"""
+        return asyncio.run(self.extract_theme(theme_name))
+    
+    async def extract_theme(self, theme_name: str, semaphore=None) -> Dict:
+        """按配置的方式提取一个主题的素材，semaphore 限制同时进行的模型请求数"""
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        if self.mode == 'article':
+            return await self.extract_theme_by_article(theme_name, semaphore)
+        return await self.extract_theme_whole(theme_name, semaphore)
+    
+    async def extract_theme_whole(self, theme_name: str, semaphore) -> Dict:
+        """整个主题的文章放进一个提示词提取（旧版方式），超出token上限时分组提取后合并；提取失败返回None"""
         theme_path = self.themes_path / theme_name
         articles_path = theme_path / "articles"
         
@@ -62,40 +101,193 @@ class MaterialExtractor:
             print(f"主题 {theme_name} 下没有文章")
             return {}
         
-        print(f"正在为主题 {theme_name} 提取素材（共{len(articles_content)}篇文章）...")
+        prompts = self.whole_prompts(theme_name, articles_content)
+        print(f"正在为主题 {theme_name} 提取素材（共{len(articles_content)}篇文章"
+              + (f"，按token上限分为{len(prompts)}组" if len(prompts) > 1 else "") + "）...")
         
-        # 构建提示内容
-        articles_text = "\n\n---\n\n".join([
-            f"文件名: {article['filename']}\n{article['content']}"
-            for article in articles_content
-        ])
+        results = await asyncio.gather(*[self.extract_chunk(prompt, semaphore) for prompt in prompts])
+        if len(results) == 1:
+            # 调用失败时返回None，主题计为失败
+            return results[0]
         
+        failed = sum(1 for result in results if result is None)
+        if failed == len(results):
+            return None
+        if failed:
+            print(f"主题 {theme_name} 中 {failed} 组文章提取失败，已跳过")
+        return self.merge_materials([self.normalize_materials(result) for result in results if result])
+    
+    def whole_prompts(self, theme_name: str, articles: List[Dict]) -> List[str]:
+        """整主题提取的提示词：文章按token上限分组，通常只有一组；单篇超出上限时截断"""
+        header = self.extract_prompt_template.format(theme_name=theme_name) + "\n\n文章内容：\n"
+        limit = self.budget.limit('extract') - self.budget.count(header)
+        texts = [self.budget.truncate(f"文件名: {article['filename']}\n{article['content']}", limit)
+                 for article in articles]
+        groups = self.budget.pack(texts, limit, cost=lambda text: self.budget.count(text) + 2)
+        return [header + "\n\n---\n\n".join(group) for group in groups]
+    
+    async def extract_chunk(self, prompt: str, semaphore):
+        """用一个提示词提取一组文章的素材，出错时返回None"""
         # 调用Gemini进行提取
         try:
-            prompt = self.extract_prompt_template.format(
-                theme_name=theme_name
-            ) + "\n\n文章内容：\n" + articles_text
-            
-            response = self.model.generate_content(prompt)
+            async with semaphore:
+                response = await self.model.generate_content_async(prompt)
             
             # 解析响应
             result_text = response.text
             
             # 尝试解析JSON
-            import re
             json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
             if json_match:
                 extracted_materials = json.loads(json_match.group())
             else:
                 # 如果不是JSON格式，尝试手动解析
                 extracted_materials = self.parse_text_response(result_text)
-            
+        
         except Exception as e:
             print(f"提取素材时出错: {e}")
-            return {}
+            return None
         
         return extracted_materials
     
+    def read_theme_articles(self, theme_name: str) -> List[Dict]:
+        """读取主题下的所有文章"""
+        articles_path = self.themes_path / theme_name / "articles"
+        articles = []
+        for md_file in sorted(articles_path.glob("*.md")):
+            with open(md_file, 'r', encoding='utf-8') as f:
+                articles.append({'filename': md_file.name, 'content': f.read()})
+        return articles
+    
+    def normalize_materials(self, materials: Dict) -> Dict:
+        """统一为 维度 -> 字符串列表，忽略未知维度和空条目"""
+        normalized = {}
+        for dimension in self.dimensions:
+            items = materials.get(dimension) or []
+            if isinstance(items, str):
+                items = items.split('\n')
+            items = [str(item).strip() for item in items if str(item).strip()]
+            if items:
+                normalized[dimension] = items
+        return normalized
+    
+    def article_prompt(self, theme_name: str, content: str) -> str:
+        # 提示词中有JSON示例，不能用format
+        return (self.article_prompt_template.replace('{theme_name}', theme_name)
+                + "\n\n文章内容：\n" + content)
+    
+    def fit_articles(self, theme_name: str, articles: List[Dict]) -> List[Dict]:
+        """逐篇提取时把超出token上限的文章截断（缓存键按截断后的内容计算）"""
+        limit = self.budget.limit('extract') - self.budget.count(self.article_prompt(theme_name, ""))
+        for article in articles:
+            content = self.budget.truncate(article['content'], limit)
+            if content != article['content']:
+                print(f"{article['filename']} 超出素材提取的token上限，只提取前 {self.budget.count(content)} tokens")
+                article['content'] = content
+        return articles
+    
+    async def extract_article(self, theme_name: str, article: Dict, semaphore, cache_key: str = None) -> Dict:
+        """提取单篇文章的素材，失败时重试，最终失败返回None；成功后立即写入缓存"""
+        prompt = self.article_prompt(theme_name, article['content'])
+        
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(2 ** attempt)
+            try:
+                async with semaphore:
+                    response = await self.model.generate_content_async(prompt)
+                result_text = response.text
+                json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
+                if json_match:
+                    materials = self.normalize_materials(json.loads(json_match.group()))
+                else:
+                    materials = self.normalize_materials(self.parse_text_response(result_text))
+            except Exception as e:
+                print(f"提取 {article['filename']} 时出错（第{attempt + 1}次）: {e}")
+                continue
+            
+            if self.cache and cache_key:
+                self.cache.put(cache_key, materials, article['filename'])
+            self.advance(theme_name)
+            return materials
+        self.advance(theme_name)
+        return None
+    
+    async def extract_theme_by_article(self, theme_name: str, semaphore=None) -> Dict:
+        """逐篇并发提取（同时请求数受 max_concurrency 限制），再合并为主题素材；全部失败时返回None"""
+        articles = self.fit_articles(theme_name, self.read_theme_articles(theme_name))
+        if not articles:
+            print(f"主题 {theme_name} 下没有文章")
+            return {}
+        
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        print(f"正在为主题 {theme_name} 逐篇提取素材（共{len(articles)}篇文章）...")
+        
+        # 先查缓存，只为新增或内容有变化的文章调用模型
+        pieces = [None] * len(articles)
+        keys = [None] * len(articles)
+        pending = []
+        for position, article in enumerate(articles):
+            if self.cache:
+                keys[position] = self.cache.key(article['content'], theme_name)
+                pieces[position] = self.cache.get(keys[position])
+            if pieces[position] is None:
+                pending.append(position)
+        if self.cache:
+            print(f"主题 {theme_name}: 缓存命中 {len(articles) - len(pending)} 篇，需要提取 {len(pending)} 篇")
+        if theme_name in self.progress:
+            self.progress[theme_name].update(done=0, total=len(pending))
+        
+        results = await asyncio.gather(*[
+            self.extract_article(theme_name, articles[position], semaphore, keys[position])
+            for position in pending
+        ])
+        for position, result in zip(pending, results):
+            pieces[position] = result
+        
+        failed = [article['filename'] for article, piece in zip(articles, pieces) if piece is None]
+        if len(failed) == len(articles):
+            print(f"主题 {theme_name} 的文章全部提取失败")
+            return None
+        if failed:
+            print(f"主题 {theme_name} 中 {len(failed)} 篇文章提取失败，已跳过: {', '.join(failed)}")
+        
+        return self.merge_materials([piece for piece in pieces if piece])
+    
+    def merge_materials(self, pieces: List[Dict]) -> Dict:
+        """合并各篇文章的素材：每个维度去掉重复和高度相似的条目，按出现的文章数从多到少排列"""
+        merged = {}
+        for dimension in self.dimensions:
+            groups = []
+            by_key = {}
+            for piece in pieces:
+                for item in piece.get(dimension, []):
+                    key = re.sub(r'[\W_]+', '', item).lower()
+                    if not key:
+                        continue
+                    grams = {key[i:i + 2] for i in range(len(key) - 1)} or {key}
+                    
+                    group = by_key.get(key)
+                    if group is None:
+                        for candidate in groups:
+                            overlap = len(grams & candidate['grams'])
+                            if overlap and overlap / len(grams | candidate['grams']) >= self.similarity:
+                                group = candidate
+                                break
+                    if group is None:
+                        group = {'text': item, 'grams': grams, 'count': 0, 'order': len(groups)}
+                        groups.append(group)
+                    by_key[key] = group
+                    group['count'] += 1
+            
+            groups.sort(key=lambda group: (-group['count'], group['order']))
+            items = [group['text'] for group in groups]
+            if self.max_items:
+                items = items[:self.max_items]
+            if items:
+                merged[dimension] = items
+        return merged
+    
     def parse_text_response(self, text: str) -> Dict:
         """解析文本格式的响应"""
         materials = {}
@@ -131,15 +323,91 @@ class MaterialExtractor:
                 else:
                     f.write(str(content))
             
-            print(f"已保存: {filename}")
+            print(f"已保存: {theme_name}/{filename}")
         
         # 保存完整的素材JSON
         json_path = materials_path / "all_materials.json"
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(materials, f, ensure_ascii=False, indent=2)
     
-    def extract_all_themes(self):
-        """为所有主题提取素材"""
+    def advance(self, theme_name: str):
+        """主题中又有一篇文章完成，更新进度"""
+        entry = self.progress.get(theme_name)
+        if entry:
+            entry['done'] += 1
+            print(f"  [{theme_name}] {entry['done']}/{entry['total']}")
+    
+    def print_progress(self):
+        """打印所有主题的进度概况"""
+        states = {}
+        for theme_name, entry in self.progress.items():
+            states.setdefault(entry['status'], []).append(theme_name)
+        
+        running = [
+            f"{theme_name} {self.progress[theme_name]['done']}/{self.progress[theme_name]['total']}"
+            if self.progress[theme_name]['total'] else theme_name
+            for theme_name in states.get('提取中', [])
+        ]
+        finished = len(self.progress) - len(states.get('等待', [])) - len(running)
+        line = f"[进度] 已完成 {finished}/{len(self.progress)} 个主题"
+        if running:
+            line += f" | 进行中: {', '.join(running)}"
+        if states.get('失败'):
+            line += f" | 失败: {', '.join(states['失败'])}"
+        print(line)
+    
+    async def extract_theme_and_save(self, theme_name: str, theme_slots, semaphore):
+        """提取一个主题并立即保存，单个主题出错不影响其他主题"""
+        async with theme_slots:
+            self.progress[theme_name]['status'] = '提取中'
+            print(f"\n处理主题: {theme_name}")
+            self.print_progress()
+            
+            try:
+                materials = await self.extract_theme(theme_name, semaphore)
+            except Exception as e:
+                print(f"主题 {theme_name} 提取失败: {e}")
+                materials = None
+            
+            if materials:
+                # 保存素材
+                self.save_materials(theme_name, materials)
+                self.progress[theme_name]['status'] = '完成'
+            else:
+                self.progress[theme_name]['status'] = '失败' if materials is None else '无素材'
+            self.print_progress()
+    
+    async def extract_themes_concurrently(self, theme_names: List[str]):
+        """同时处理至多 theme_concurrency 个主题，所有主题共用 max_concurrency 个模型请求名额"""
+        theme_slots = asyncio.Semaphore(max(1, self.theme_concurrency))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.progress = {theme_name: {'status': '等待', 'done': 0, 'total': 0} for theme_name in theme_names}
+        
+        await asyncio.gather(*[
+            self.extract_theme_and_save(theme_name, theme_slots, semaphore) for theme_name in theme_names
+        ])
+    
+    def plan_theme(self, theme_name: str):
+        """dry-run：记录一个主题需要的模型调用，逐篇提取时缓存命中的文章不计入"""
+        if not (self.themes_path / theme_name / "articles").exists():
+            print(f"主题 {theme_name} 不存在")
+            return
+        articles = self.read_theme_articles(theme_name)
+        
+        if self.mode != 'article':
+            prompts = self.whole_prompts(theme_name, articles)
+        else:
+            articles = self.fit_articles(theme_name, articles)
+            if self.cache:
+                articles = [article for article in articles
+                            if self.cache.get(self.cache.key(article['content'], theme_name)) is None]
+            prompts = [self.article_prompt(theme_name, article['content']) for article in articles]
+        for prompt in prompts:
+            self.budget.record('extract', prompt, self.max_concurrency)
+        print(f"主题 {theme_name}: 需要调用模型 {len(prompts)} 次")
+    
+    def extract_all_themes(self, dry_run: bool = False):
+        """为所有主题提取素材，dry_run 时只报告预计的模型调用次数、token数和耗时"""
         # 读取分类结果
         classification_path = self.themes_path / "classification.json"
         
@@ -150,18 +418,23 @@ class MaterialExtractor:
         with open(classification_path, 'r', encoding='utf-8') as f:
             classification = json.load(f)
         
-        for theme in classification['themes']:
-            theme_name = theme['theme_name']
-            print(f"\n处理主题: {theme_name}")
-            
-            # 提取素材
-            materials = self.extract_materials_for_theme(theme_name)
-            
-            if materials:
-                # 保存素材
-                self.save_materials(theme_name, materials)
+        theme_names = [theme['theme_name'] for theme in classification['themes']]
+        if dry_run:
+            for theme_name in theme_names:
+                self.plan_theme(theme_name)
+            print("\n[dry-run] 预计的模型调用：")
+            print(self.budget.report())
+            return
+        
+        try:
+            asyncio.run(self.extract_themes_concurrently(theme_names))
+        finally:
+            progress, self.progress = self.progress, {}
         
-        print("\n所有主题的素材提取完成！")
+        failed = [theme_name for theme_name, entry in progress.items() if entry['status'] == '失败']
+        print("\n所有主题的素材提取完成！" + (f"（{len(failed)} 个主题失败: {', '.join(failed)}）" if failed else ""))
+        if self.cache and self.mode == 'article':
+            print(self.cache.summary())
 
 if __name__ == "__main__":
     # 测试提取器
@@ -0,0 +1,303 @@
+import asyncio
+import aiohttp
+
+from rate_limiter import AdaptiveRateLimiter
+from http_cache import HttpCache
+from cassette import Cassette, RecordingSession, ReplaySession
+
+# 微信拒绝非客户端访问时返回的提示页
+WECHAT_INTERSTITIAL = '请在微信客户端打开链接'
+
+# 视为被限流的状态码
+THROTTLE_STATUS = (429, 403)
+
+# 可以重试的网络错误（连接失败、连接中断、超时）
+RETRY_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# 流式写盘的分块大小
+CHUNK_SIZE = 64 * 1024
+
+# 没有明确类型时也允许下载的content-type
+GENERIC_CONTENT_TYPES = ('', 'application/octet-stream', 'binary/octet-stream')
+
+class DownloadAborted(Exception):
+    """下载被提前终止（非图片类型或超过大小上限）"""
+
+class AsyncFetcher:
+    """异步抓取引擎，页面和图片共用一个带连接池的keep-alive会话"""
+    
+    def __init__(self, config, headers=None, rate_limiter=None, cache=None, cassette=None):
+        system_config = config.get('system', {})
+        
+        # 录制/回放模式（cassette配置），未启用时为None
+        self.cassette = cassette if cassette is not None else Cassette.from_config(config)
+        replaying = self.cassette is not None and self.cassette.mode == 'replay'
+        if replaying and rate_limiter is None and not self.cassette.respect_rate_limit:
+            # 回放时全速运行
+            rate_limiter = AdaptiveRateLimiter(initial_rate=1e9, min_rate=1e9, max_rate=1e9, burst=1e9)
+        
+        self.max_concurrent = system_config.get('max_concurrent_requests', 5)
+        self.timeout = system_config.get('timeout', 60)
+        self.retry_times = system_config.get('retry_times', 3)
+        # 网络错误或被限流后的重试等待（秒），每次重试翻倍；回放时不等待
+        self.retry_delay = 0 if replaying else system_config.get('retry_delay', 1.0)
+        self.max_download_bytes = system_config.get('max_image_bytes', 10 * 1024 * 1024)
+        
+        # 每个主机独立限速，根据响应自适应调整
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter.from_config(config)
+        
+        # 持久化HTTP缓存，未启用时为None
+        if self.recording or replaying:
+            # 录制时不读缓存，保证每个响应都被录下；回放时只用录制的响应，也不写入真实缓存
+            if cache is not None:
+                cache.close()
+            self.cache = None
+        else:
+            self.cache = cache if cache is not None else HttpCache.from_config(config)
+        
+        # Accept-Encoding交给aiohttp按已安装的解码器自动协商，避免收到无法解压的br
+        self.headers = {
+            key: value for key, value in (headers or {}).items()
+            if key.lower() != 'accept-encoding'
+        }
+        
+        self.session = None
+    
+    @property
+    def recording(self):
+        """是否处于录制模式"""
+        return self.cassette is not None and self.cassette.mode == 'record'
+    
+    async def __aenter__(self):
+        await self.open()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def open(self):
+        """创建共享会话，回放模式下不访问网络"""
+        if self.session is None and self.cassette is not None and self.cassette.mode == 'replay':
+            self.session = ReplaySession(self.cassette)
+        if self.session is None:
+            # 页面和图片分属不同主机，连接总数为并发数的两倍
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrent * 2,
+                limit_per_host=self.max_concurrent,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            if self.cassette is not None:
+                self.session = RecordingSession(self.session, self.cassette)
+    
+    async def close(self):
+        """关闭会话并释放连接"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.cache is not None:
+            self.cache.close()
+    
+    def cached_request(self, url, headers):
+        """查询缓存，返回 (缓存条目, 是否新鲜, 加上条件请求头后的请求头)"""
+        headers = dict(headers or {})
+        if self.cache is None:
+            return None, False, headers
+        
+        entry = self.cache.lookup(url)
+        if entry is None:
+            return None, False, headers
+        if self.cache.is_fresh(entry):
+            self.cache.record_hit(entry)
+            return entry, True, headers
+        
+        headers.update(self.cache.conditional_headers(entry))
+        return entry, False, headers
+    
+    async def backoff(self, url, attempt, reason):
+        """第 attempt 次请求失败后等待再重试"""
+        delay = self.retry_delay * (2 ** attempt)
+        print(f"[WARNING] {reason}，{delay:.1f} 秒后重试（{attempt + 1}/{self.retry_times}）: {url[:80]}")
+        await asyncio.sleep(delay)
+    
+    async def fetch_text(self, url, headers=None):
+        """获取页面文本，返回 (状态码, 文本, 最终URL)"""
+        entry, fresh, headers = self.cached_request(url, headers)
+        if fresh:
+            return 200, self.cache.read(entry).decode('utf-8', errors='replace'), entry['final_url']
+        
+        for attempt in range(self.retry_times + 1):
+            await self.rate_limiter.acquire(url)
+            try:
+                async with self.session.get(url, headers=headers, allow_redirects=True) as response:
+                    body = await response.read()
+                    text = body.decode('utf-8', errors='replace')
+                    status, final_url = response.status, str(response.url)
+                    response_headers = response.headers
+            except RETRY_ERRORS as e:
+                if attempt >= self.retry_times:
+                    raise
+                await self.backoff(url, attempt, f"请求出错 {type(e).__name__}")
+                continue
+            
+            if status == 304 and entry is not None:
+                self.rate_limiter.record_success(url)
+                self.cache.refresh(entry, response_headers)
+                return 200, self.cache.read(entry).decode('utf-8', errors='replace'), entry['final_url']
+            
+            if status in THROTTLE_STATUS:
+                self.rate_limiter.record_throttle(url)
+                if attempt < self.retry_times:
+                    await self.backoff(url, attempt, f"被限流（{status}）")
+                    continue
+            elif status == 200 and WECHAT_INTERSTITIAL in text:
+                # 提示页交给调用方处理（如Selenium），这里只负责降速，也不缓存
+                self.rate_limiter.record_throttle(url)
+            elif status == 200:
+                self.rate_limiter.record_success(url)
+                if self.cache is not None:
+                    self.cache.record_miss()
+                    self.cache.store(url, response_headers, body=body, final_url=final_url)
+            return status, text, final_url
+    
+    async def fetch_bytes(self, url, headers=None):
+        """获取二进制内容，返回 (状态码, content-type, 内容)"""
+        entry, fresh, headers = self.cached_request(url, headers)
+        if fresh:
+            return 200, entry['content_type'], self.cache.read(entry)
+        
+        for attempt in range(self.retry_times + 1):
+            await self.rate_limiter.acquire(url)
+            try:
+                async with self.session.get(url, headers=headers, allow_redirects=True) as response:
+                    body = await response.read()
+                    status, content_type = response.status, response.headers.get('content-type', '')
+                    response_headers = response.headers
+            except RETRY_ERRORS as e:
+                if attempt >= self.retry_times:
+                    raise
+                await self.backoff(url, attempt, f"请求出错 {type(e).__name__}")
+                continue
+            
+            if status == 304 and entry is not None:
+                self.rate_limiter.record_success(url)
+                self.cache.refresh(entry, response_headers)
+                return 200, entry['content_type'], self.cache.read(entry)
+            
+            if status in THROTTLE_STATUS:
+                self.rate_limiter.record_throttle(url)
+                if attempt < self.retry_times:
+                    await self.backoff(url, attempt, f"被限流（{status}）")
+                    continue
+            elif status == 200:
+                self.rate_limiter.record_success(url)
+                if self.cache is not None:
+                    self.cache.record_miss()
+                    self.cache.store(url, response_headers, body=body)
+            return status, content_type, body
+    
+    def copy_cached(self, entry, filepath, hasher=None):
+        """把缓存正文复制到目标文件，返回 (200, content-type, 字节数, 内容哈希)"""
+        size = 0
+        digest = hasher() if hasher is not None else None
+        with open(entry['body_path'], 'rb') as src, open(filepath, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(chunk)
+                size += len(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+        return 200, entry['content_type'], size, digest.hexdigest() if digest is not None else None
+    
+    async def download_to_file(self, url, filepath, headers=None, hasher=None):
+        """流式下载图片到文件，返回 (状态码, content-type, 字节数, 内容哈希)
+        
+        hasher 为哈希构造函数（如 hashlib.sha256），不为空时边下载边计算内容哈希（十六进制），否则哈希为None。
+        下载中途网络出错时删除已写内容并从头重试。
+        非图片类型或超过 system.max_image_bytes 时删除已写内容并抛出 DownloadAborted
+        """
+        entry, fresh, headers = self.cached_request(url, headers)
+        if fresh:
+            return self.copy_cached(entry, filepath, hasher)
+        
+        for attempt in range(self.retry_times + 1):
+            await self.rate_limiter.acquire(url)
+            try:
+                result = await self.stream_to_file(url, filepath, headers, entry, hasher)
+            except RETRY_ERRORS as e:
+                if attempt >= self.retry_times:
+                    raise
+                await self.backoff(url, attempt, f"下载出错 {type(e).__name__}")
+                continue
+            
+            if result[0] in THROTTLE_STATUS:
+                self.rate_limiter.record_throttle(url)
+                if attempt < self.retry_times:
+                    await self.backoff(url, attempt, f"被限流（{result[0]}）")
+                    continue
+            return result
+    
+    async def stream_to_file(self, url, filepath, headers, entry, hasher):
+        """发出一次下载请求，返回 (状态码, content-type, 字节数, 内容哈希)"""
+        async with self.session.get(url, headers=headers, allow_redirects=True) as response:
+            status = response.status
+            content_type = response.headers.get('content-type', '')
+            
+            if status == 304 and entry is not None:
+                self.rate_limiter.record_success(url)
+                self.cache.refresh(entry, response.headers)
+                return self.copy_cached(entry, filepath, hasher)
+            if status != 200:
+                return status, content_type, 0, None
+            
+            self.rate_limiter.record_success(url)
+            
+            # 先看响应头，尽早放弃
+            mime = content_type.split(';')[0].strip().lower()
+            if not mime.startswith('image/') and mime not in GENERIC_CONTENT_TYPES:
+                raise DownloadAborted(f"非图片类型: {content_type}")
+            if (response.content_length or 0) > self.max_download_bytes:
+                raise DownloadAborted(f"图片过大: {response.content_length} 字节")
+            
+            size = 0
+            digest = hasher() if hasher is not None else None
+            try:
+                with open(filepath, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_download_bytes:
+                            raise DownloadAborted(f"图片超过 {self.max_download_bytes} 字节")
+                        f.write(chunk)
+                        if digest is not None:
+                            digest.update(chunk)
+            except BaseException:
+                filepath.unlink(missing_ok=True)
+                raise
+            
+            if self.cache is not None:
+                self.cache.record_miss()
+                self.cache.store(url, response.headers, filepath=filepath)
+            
+            return status, content_type, size, digest.hexdigest() if digest is not None else None
+
+async def gather_bounded(coroutines, limit, progress=None, postfix=None):
+    """以有限并发执行协程，按输入顺序返回结果
+    
+    postfix 为可选的回调，返回的字符串会显示在进度条后面
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+    
+    async def run(coroutine):
+        async with semaphore:
+            result = await coroutine
+        if progress is not None:
+            if postfix is not None:
+                progress.set_postfix_str(postfix())
+            progress.update(1)
+        return result
+    
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
@@ -0,0 +1,199 @@
+import os
+import re
+import time
+import shutil
+import sqlite3
+import hashlib
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+
+class HttpCache:
+    """持久化HTTP缓存：记录ETag/Last-Modified/Cache-Control，支持条件请求，按总大小做LRU淘汰"""
+    
+    def __init__(self, cache_path, max_size_mb=2048, default_ttl=0):
+        self.cache_path = Path(cache_path)
+        self.bodies_path = self.cache_path / "bodies"
+        self.bodies_path.mkdir(parents=True, exist_ok=True)
+        
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        # 响应没有给出缓存时间时的默认有效期（秒），0表示每次都重新验证
+        self.default_ttl = default_ttl
+        
+        self.db = sqlite3.connect(str(self.cache_path / "cache.db"))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                final_url TEXT,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                cache_control TEXT,
+                expires_at REAL,
+                stored_at REAL,
+                last_access REAL,
+                size INTEGER
+            )
+        ''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)')
+        self.db.commit()
+        
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+    
+    @classmethod
+    def from_config(cls, config):
+        """从配置创建，system.http_cache.enabled 为false时返回None"""
+        cache_config = config.get('system', {}).get('http_cache', {}) or {}
+        if not cache_config.get('enabled', True):
+            return None
+        cache_path = config.get('paths', {}).get('http_cache', 'data/http_cache')
+        return cls(
+            cache_path,
+            max_size_mb=cache_config.get('max_size_mb', 2048),
+            default_ttl=cache_config.get('default_ttl', 0)
+        )
+    
+    def close(self):
+        self.db.close()
+    
+    def key_for(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+    
+    def body_path(self, key):
+        return self.bodies_path / key[:2] / key
+    
+    def lookup(self, url):
+        """查找缓存条目，正文文件丢失时视为不存在"""
+        key = self.key_for(url)
+        row = self.db.execute('SELECT * FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry['body_path'] = self.body_path(key)
+        if not entry['body_path'].exists():
+            self.remove(key)
+            return None
+        return entry
+    
+    def is_fresh(self, entry):
+        return entry['expires_at'] is not None and entry['expires_at'] > time.time()
+    
+    def conditional_headers(self, entry):
+        """重新验证用的请求头"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def expires_at(self, headers):
+        """根据Cache-Control/Expires计算过期时间，不可缓存时返回None"""
+        now = time.time()
+        cache_control = (headers.get('Cache-Control') or '').lower()
+        
+        if 'no-store' in cache_control:
+            return None
+        if 'no-cache' in cache_control:
+            return now
+        
+        max_age = re.search(r'max-age=(\d+)', cache_control)
+        if max_age:
+            return now + int(max_age.group(1))
+        
+        if headers.get('Expires'):
+            try:
+                return parsedate_to_datetime(headers['Expires']).timestamp()
+            except (TypeError, ValueError):
+                return now
+        
+        return now + self.default_ttl
+    
+    def read(self, entry):
+        """读取缓存正文"""
+        with open(entry['body_path'], 'rb') as f:
+            return f.read()
+    
+    def record_hit(self, entry, revalidated=False):
+        """命中缓存（新鲜条目或304）时更新访问时间"""
+        self.stats['revalidated' if revalidated else 'hits'] += 1
+        self.db.execute('UPDATE entries SET last_access = ? WHERE key = ?',
+                        (time.time(), self.key_for(entry['url'])))
+        self.db.commit()
+    
+    def record_miss(self):
+        self.stats['misses'] += 1
+    
+    def refresh(self, entry, headers):
+        """处理304：沿用旧正文，用新响应头更新有效期和校验值"""
+        expires_at = self.expires_at(headers)
+        self.db.execute('''
+            UPDATE entries SET expires_at = ?, etag = COALESCE(?, etag),
+                last_modified = COALESCE(?, last_modified), last_access = ?
+            WHERE key = ?
+        ''', (expires_at if expires_at is not None else time.time(), headers.get('ETag'),
+              headers.get('Last-Modified'), time.time(), self.key_for(entry['url'])))
+        self.db.commit()
+        self.record_hit(entry, revalidated=True)
+    
+    def store(self, url, headers, body=None, filepath=None, final_url=None):
+        """保存200响应，正文可以是字节或已下载的文件"""
+        expires_at = self.expires_at(headers)
+        if expires_at is None:
+            return
+        
+        key = self.key_for(url)
+        path = self.body_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        
+        if filepath is not None:
+            # 已落盘的文件优先用硬链接，避免再占一份空间
+            try:
+                os.link(filepath, tmp_path)
+            except OSError:
+                shutil.copyfile(filepath, tmp_path)
+            size = os.path.getsize(tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            size = len(body)
+        os.replace(tmp_path, path)
+        
+        now = time.time()
+        self.db.execute('''
+            INSERT OR REPLACE INTO entries
+                (key, url, final_url, content_type, etag, last_modified, cache_control,
+                 expires_at, stored_at, last_access, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (key, url, final_url or url, headers.get('Content-Type', ''), headers.get('ETag'),
+              headers.get('Last-Modified'), headers.get('Cache-Control'), expires_at, now, now, size))
+        self.db.commit()
+        self.stats['stored'] += 1
+        
+        self.evict()
+    
+    def remove(self, key):
+        self.body_path(key).unlink(missing_ok=True)
+        self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self.db.commit()
+    
+    def evict(self):
+        """总大小超过上限时，按最久未访问的顺序删除"""
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_size:
+            return
+        
+        for row in self.db.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+            if total <= self.max_size:
+                break
+            self.remove(row['key'])
+            total -= row['size']
+            self.stats['evicted'] += 1
+    
+    def summary(self):
+        """缓存命中情况摘要"""
+        stats = self.stats
+        return (f"命中 {stats['hits']} 次，304重新验证 {stats['revalidated']} 次，"
+                f"未命中 {stats['misses']} 次，淘汰 {stats['evicted']} 条")
@@ -0,0 +1,114 @@
+import os
+import json
+import asyncio
+import shutil
+import hashlib
+import uuid
+from pathlib import Path
+
+# 图片库在 images 目录下的子目录名，遍历文章图片目录时需要跳过
+BLOBS_DIRNAME = "_blobs"
+
+class ImageStore:
+    """按内容寻址的图片库：以图片内容的sha256命名，相同图片只存一份"""
+    
+    def __init__(self, images_path):
+        self.blobs_path = Path(images_path) / BLOBS_DIRNAME
+        self.tmp_path = self.blobs_path / "tmp"
+        self.tmp_path.mkdir(parents=True, exist_ok=True)
+        
+        # URL -> {sha256, ext, size}，只追加写入
+        self.index_path = self.blobs_path / "url_index.jsonl"
+        self.url_index = self.load_index()
+        
+        # URL -> asyncio.Future，正在下载的图片；多篇文章同时引用同一URL时只下载一次
+        self.downloads = {}
+    
+    def load_index(self):
+        """读取URL索引，同一URL以最后一条为准"""
+        url_index = {}
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 中断时可能留下不完整的最后一行
+                        continue
+                    url_index[entry['url']] = entry
+        return url_index
+    
+    def blob_path(self, sha256, ext):
+        """图片在库中的路径，按哈希前两位分目录"""
+        return self.blobs_path / sha256[:2] / f"{sha256}{ext}"
+    
+    def temp_path(self):
+        """下载用的临时文件路径"""
+        return self.tmp_path / f"{uuid.uuid4().hex}.part"
+    
+    def lookup(self, url):
+        """查找已下载过的URL，返回库中文件路径，没有则返回None"""
+        entry = self.url_index.get(url)
+        if entry:
+            blob = self.blob_path(entry['sha256'], entry['ext'])
+            if blob.exists():
+                return blob
+        return None
+    
+    def pending_download(self, url):
+        """同一URL正在下载时返回其Future（结果为库中文件路径，失败为None），否则返回None"""
+        return self.downloads.get(url)
+    
+    def start_download(self, url):
+        """登记开始下载URL，之后请求同一URL的调用方等待这次下载"""
+        self.downloads[url] = asyncio.get_running_loop().create_future()
+    
+    def finish_download(self, url, blob):
+        """下载结束（blob 为None表示失败），通知等待的调用方"""
+        future = self.downloads.pop(url, None)
+        if future is not None and not future.done():
+            future.set_result(blob)
+    
+    def add(self, url, part_path, sha256, ext, size):
+        """把下载好的临时文件收入图片库，返回库中文件路径"""
+        blob = self.blob_path(sha256, ext)
+        if blob.exists():
+            # 内容相同的图片已经存在
+            Path(part_path).unlink()
+        else:
+            blob.parent.mkdir(exist_ok=True)
+            os.replace(part_path, blob)
+        
+        entry = {'url': url, 'sha256': sha256, 'ext': ext, 'size': size}
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.url_index[url] = entry
+        
+        return blob
+    
+    @staticmethod
+    def link(blob, dest):
+        """在文章目录中建立指向库文件的链接：优先硬链接，其次符号链接，最后复制"""
+        dest = Path(dest)
+        if dest.exists() or dest.is_symlink():
+            dest.unlink()
+        try:
+            os.link(blob, dest)
+        except OSError:
+            try:
+                os.symlink(Path(blob).resolve(), dest)
+            except OSError:
+                shutil.copy2(blob, dest)
+        return dest
+    
+    @staticmethod
+    def file_digest(path):
+        """计算文件内容的sha256"""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
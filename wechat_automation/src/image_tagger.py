@@ -6,6 +6,9 @@ import yaml
 from PIL import Image
 from typing import List, Dict
 
+from image_store import ImageStore, BLOBS_DIRNAME
+from dedup import load_duplicate_ids
+
 class ImageTagger:
     """图片标签系统，使用Gemini视觉能力分析图片"""
     
@@ -19,6 +22,7 @@ class ImageTagger:
         
         # 路径配置
         self.images_path = Path(self.config['paths']['images'])
+        self.markdown_path = Path(self.config['paths']['markdown'])
         
         # 图片标签提示词
         self.tag_prompt = """请分析这张图片，并提供以下信息：
@@ -66,9 +70,18 @@ class ImageTagger:
         """为所有图片打标签"""
         image_metadata = {}
         
-        # 遍历所有文章的图片文件夹
+        # 相同内容的图片（来自图片库的链接）只分析一次
+        analysis_by_digest = {}
+        
+        # 近似重复的文章不再分析图片
+        duplicate_ids = load_duplicate_ids(self.markdown_path)
+        
+        # 遍历所有文章的图片文件夹（跳过图片库本身）
         for article_dir in self.images_path.iterdir():
-            if article_dir.is_dir():
+            if article_dir.name in duplicate_ids:
+                print(f"跳过重复文章 {article_dir.name} 的图片")
+                continue
+            if article_dir.is_dir() and article_dir.name != BLOBS_DIRNAME:
                 print(f"\n处理文章 {article_dir.name} 的图片...")
                 
                 article_images = {}
@@ -76,10 +89,17 @@ class ImageTagger:
                 # 遍历该文章的所有图片
                 for image_file in article_dir.iterdir():
                     if image_file.suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-                        print(f"分析图片: {image_file.name}")
+                        digest = ImageStore.file_digest(image_file)
                         
-                        # 分析图片
-                        analysis = self.analyze_image(image_file)
+                        if digest in analysis_by_digest:
+                            print(f"复用已有分析: {image_file.name}")
+                            analysis = analysis_by_digest[digest]
+                        else:
+                            print(f"分析图片: {image_file.name}")
+                            
+                            # 分析图片
+                            analysis = self.analyze_image(image_file)
+                            analysis_by_digest[digest] = analysis
                         
                         # 保存分析结果
                         article_images[image_file.name] = {
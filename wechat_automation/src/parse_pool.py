@@ -0,0 +1,68 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from article_parser import parse_article, to_html
+
+def parse_page(html_text, profile):
+    """在子进程中解析页面，只返回可序列化的结果，页面为空时返回None"""
+    parsed = parse_article(html_text, profile)
+    if parsed is None:
+        return None
+    return {
+        'title': parsed['title'],
+        'selector': parsed['selector'],
+        'html': to_html(parsed['content']) if parsed['content'] else None,
+        'images': parsed['images'],
+    }
+
+class ParsePool:
+    """HTML解析进程池，避免解析大页面时阻塞爬虫的事件循环
+    
+    同时提交给进程池的页面最多 max_pending 个，已抓取但等待解析的页面
+    会继续占用爬虫的页面名额，从而限制后续抓取，内存中不会堆积未解析的页面。
+    未打开（或 workers 为0）时在当前进程中直接解析。
+    """
+    
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or max(self.workers, 1) * 2
+        self.executor = None
+        self.slots = None
+    
+    @classmethod
+    def from_config(cls, config):
+        """从 system.parse_workers / system.max_pending_parses 配置创建"""
+        system_config = config.get('system', {})
+        return cls(
+            workers=system_config.get('parse_workers'),
+            max_pending=system_config.get('max_pending_parses')
+        )
+    
+    async def open(self):
+        # 信号量需要在事件循环中创建
+        self.slots = asyncio.Semaphore(self.max_pending)
+        if self.workers > 0:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+    
+    async def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.slots = None
+    
+    async def __aenter__(self):
+        return await self.open()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def parse(self, html_text, profile):
+        """解析页面，返回 parse_page 的结果"""
+        if self.executor is None:
+            return parse_page(html_text, profile)
+        
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, parse_page, html_text, profile)
\ No newline at end of file
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+
+class TokenBucket:
+    """单个主机的令牌桶"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    def refill(self):
+        """按经过的时间补充令牌"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        """取走一个令牌，不足时等待"""
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AdaptiveRateLimiter:
+    """按主机划分的令牌桶限速器，采用AIMD（加性增、乘性减）自适应调整速率"""
+    
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=10.0, increase_step=0.1,
+                 decrease_factor=0.5, burst=2, decrease_interval=2.0, hosts=None):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        self.decrease_interval = decrease_interval
+        
+        # 单独覆盖某些主机的初始速率和上限
+        self.host_overrides = hosts or {}
+        
+        self.buckets = {}
+        self.stats = {}
+        self.last_decrease = {}
+    
+    @classmethod
+    def from_config(cls, config):
+        """从 system.rate_limit 配置创建"""
+        rate_config = config.get('system', {}).get('rate_limit', {}) or {}
+        return cls(**rate_config)
+    
+    def host_of(self, url):
+        return urlparse(url).hostname or ''
+    
+    def bucket_for(self, host):
+        """获取（必要时创建）主机对应的令牌桶"""
+        if host not in self.buckets:
+            override = self.host_overrides.get(host, {})
+            rate = override.get('initial_rate', self.initial_rate)
+            self.buckets[host] = TokenBucket(rate, override.get('burst', self.burst))
+            self.stats[host] = {'requests': 0, 'clean': 0, 'throttled': 0}
+            self.last_decrease[host] = 0.0
+        return self.buckets[host]
+    
+    def max_rate_for(self, host):
+        return self.host_overrides.get(host, {}).get('max_rate', self.max_rate)
+    
+    async def acquire(self, url):
+        """请求前调用，按主机限速"""
+        host = self.host_of(url)
+        await self.bucket_for(host).acquire()
+        self.stats[host]['requests'] += 1
+    
+    def record_success(self, url):
+        """正常响应：加性提高速率"""
+        host = self.host_of(url)
+        bucket = self.bucket_for(host)
+        bucket.rate = min(self.max_rate_for(host), bucket.rate + self.increase_step)
+        self.stats[host]['clean'] += 1
+    
+    def record_throttle(self, url):
+        """被限流（429/403/微信客户端提示页）：乘性降低速率"""
+        host = self.host_of(url)
+        bucket = self.bucket_for(host)
+        self.stats[host]['throttled'] += 1
+        
+        # 同一批在途请求可能同时被拒，一个间隔内只降一次
+        now = time.monotonic()
+        if now - self.last_decrease[host] < self.decrease_interval:
+            return
+        self.last_decrease[host] = now
+        
+        bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+        # 清空令牌，立即放慢
+        bucket.tokens = 0
+        print(f"[WARNING] {host} 触发限流，速率降至 {bucket.rate:.2f} 次/秒")
+    
+    def get_rates(self):
+        """返回各主机当前速率（次/秒）和计数"""
+        return {
+            host: dict(self.stats[host], rate=round(bucket.rate, 3))
+            for host, bucket in self.buckets.items()
+        }
+    
+    def summary(self):
+        """简短的速率摘要，用于进度条显示"""
+        return ' '.join(f"{host}={bucket.rate:.1f}/s" for host, bucket in self.buckets.items())
@@ -0,0 +1,122 @@
+import os
+import gzip
+import html
+import time
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 压缩格式 -> 文件后缀
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+class RawStore:
+    """原始文章存储：默认只保存正文区域（压缩），可选保留完整页面和调试文件"""
+    
+    def __init__(self, raw_articles_path, mode='compact', compression='gzip', keep_full_html=False,
+                 debug_dumps=False, debug_retention_days=7):
+        self.raw_articles_path = Path(raw_articles_path)
+        self.raw_articles_path.mkdir(parents=True, exist_ok=True)
+        
+        # compact: 只保存正文区域；full: 与旧版一样保存完整页面
+        self.mode = mode
+        self.keep_full_html = keep_full_html
+        self.debug_dumps = debug_dumps
+        self.debug_retention_days = debug_retention_days
+        
+        if compression == 'zstd' and zstandard is None:
+            print("[WARNING] 未安装zstandard，改用gzip压缩（pip install zstandard）")
+            compression = 'gzip'
+        if compression not in EXTENSIONS:
+            raise ValueError(f"不支持的压缩格式: {compression}")
+        self.compression = compression
+    
+    @classmethod
+    def from_config(cls, config):
+        """从 storage 配置创建"""
+        storage_config = config.get('storage', {}) or {}
+        return cls(
+            config['paths']['raw_articles'],
+            mode=storage_config.get('mode', 'compact'),
+            compression=storage_config.get('compression', 'gzip'),
+            keep_full_html=storage_config.get('keep_full_html', False),
+            debug_dumps=storage_config.get('debug_dumps', False),
+            debug_retention_days=storage_config.get('debug_retention_days', 7)
+        )
+    
+    def compress(self, data):
+        if self.compression == 'gzip':
+            return gzip.compress(data, compresslevel=6)
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return data
+    
+    def write(self, path, text):
+        """压缩后原子写入，返回写入的字节数"""
+        data = self.compress(text.encode('utf-8'))
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+    
+    def compact_document(self, title, content_html):
+        """只包含标题和正文区域的HTML，转换器可以按原方式解析"""
+        title = html.escape(title or '')
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+                f'<meta property="og:title" content="{title}"><title>{title}</title>'
+                f'</head><body>{content_html}</body></html>')
+    
+    def save(self, article_id, title, content_html, full_html):
+        """保存文章，返回 (文件路径, 写入字节数)"""
+        ext = EXTENSIONS[self.compression]
+        
+        if self.mode == 'full':
+            path = self.raw_articles_path / f"{article_id}.html{ext}"
+            return path, self.write(path, full_html)
+        
+        if self.keep_full_html:
+            self.write(self.raw_articles_path / f"{article_id}.full.html{ext}", full_html)
+        
+        path = self.raw_articles_path / f"{article_id}.html{ext}"
+        return path, self.write(path, self.compact_document(title, content_html))
+    
+    @staticmethod
+    def load(path):
+        """读取文章HTML，按后缀自动解压，兼容旧版未压缩的文件"""
+        path = Path(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        if path.suffix == '.gz':
+            data = gzip.decompress(data)
+        elif path.suffix == '.zst':
+            if zstandard is None:
+                raise RuntimeError(f"读取 {path.name} 需要安装zstandard（pip install zstandard）")
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        
+        return data.decode('utf-8')
+    
+    def save_debug(self, name, text):
+        """保存未能解析的页面用于调试，未开启 debug_dumps 时不保存，返回路径或None"""
+        if not self.debug_dumps:
+            return None
+        path = self.raw_articles_path / f"debug_{name}.html"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+    
+    def cleanup_debug(self):
+        """删除超过保留天数的调试文件，返回删除的数量"""
+        cutoff = time.time() - self.debug_retention_days * 86400
+        removed = 0
+        for path in self.raw_articles_path.glob("debug_*.html"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
\ No newline at end of file
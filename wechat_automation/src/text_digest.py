@@ -0,0 +1,119 @@
+import re
+import json
+import math
+import hashlib
+from collections import Counter
+from pathlib import Path
+
+# 摘要记录的格式变化时加1
+DIGEST_VERSION = 1
+
+CJK_CHAR = re.compile(r'[㐀-䶿一-鿿豈-﫿]')
+CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+ASCII_WORD = re.compile(r'[A-Za-z][A-Za-z0-9+#.-]*[A-Za-z0-9+#]|[A-Za-z]{2,}')
+
+# Markdown标记
+MD_IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+MD_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+MD_PREFIX = re.compile(r'^\s*(#{1,6}|>|-|\d+\.|\|)\s*', re.M)
+MD_MARKUP = re.compile(r'```\w*|\\([*_|\\])|[*`|]|-{3,}')
+
+# 含这些字的二元组基本是虚词搭配，不作为关键词
+STOP_CHARS = set("的了是在和与及或等也都而就把被这那个之其中为以对从到将于有我你他她它们吗呢吧啊")
+STOP_WORDS = {'the', 'and', 'for', 'with', 'that', 'this', 'from', 'are', 'was', 'you', 'your', 'http', 'https', 'www', 'com'}
+
+def plain_text(markdown):
+    """去掉Markdown标记（图片、链接地址、标题和列表前缀等），只保留文字"""
+    text = MD_IMAGE.sub('', markdown)
+    text = MD_LINK.sub(r'\1', text)
+    text = MD_PREFIX.sub('', text)
+    text = MD_MARKUP.sub(lambda m: m.group(1) or '', text)
+    return re.sub(r'\s*\n\s*', '\n', text).strip()
+
+def estimate_tokens(text):
+    """粗略估算token数：中文每字约1个token，其他字符约4个一个"""
+    cjk = len(CJK_CHAR.findall(text))
+    other = len(re.sub(r'\s', '', text)) - cjk
+    return cjk + math.ceil(max(other, 0) / 4)
+
+def features(text):
+    """文本特征：英文单词和中文二元组及其出现次数"""
+    counts = Counter()
+    for word in ASCII_WORD.findall(text):
+        word = word.lower()
+        if word not in STOP_WORDS:
+            counts[word] += 1
+    for run in CJK_RUN.findall(text):
+        for i in range(len(run) - 1):
+            gram = run[i:i + 2]
+            if gram[0] not in STOP_CHARS and gram[1] not in STOP_CHARS:
+                counts[gram] += 1
+    return counts
+
+def top_keywords(counts, limit=15):
+    """出现至少两次的高频特征"""
+    return [word for word, count in counts.most_common(limit) if count > 1]
+
+def simhash(counts, bits=64):
+    """按特征频次加权的SimHash指纹，相似文章的指纹汉明距离小"""
+    weights = [0] * bits
+    for feature, count in counts.items():
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=bits // 8).digest(), 'big')
+        for bit in range(bits):
+            weights[bit] += count if value >> bit & 1 else -count
+    fingerprint = 0
+    for bit in range(bits):
+        if weights[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def lead_excerpt(text, limit):
+    """正文开头的摘录，尽量在句末截断"""
+    if len(text) <= limit:
+        return text
+    excerpt = text[:limit]
+    cut = max(excerpt.rfind(mark) for mark in '。！？\n')
+    if cut > limit // 2:
+        excerpt = excerpt[:cut + 1]
+    return excerpt.strip() + "…"
+
+def make_digest(article_id, title, markdown, markdown_path=None, image_count=0, excerpt_chars=600):
+    """根据转换后的Markdown生成文章摘要记录"""
+    # 去掉转换时添加的标题行
+    body = markdown
+    if title and body.startswith(f"# {title}"):
+        body = body[len(title) + 2:]
+    text = plain_text(body)
+    counts = features(text)
+    
+    return {
+        'id': article_id,
+        'title': title,
+        'markdown_path': markdown_path,
+        'chars': len(text),
+        'tokens': estimate_tokens(text),
+        'lead': lead_excerpt(text, excerpt_chars),
+        'keywords': top_keywords(counts),
+        'simhash': f"{simhash(counts):016x}",
+        'images': image_count,
+        'version': DIGEST_VERSION,
+    }
+
+def digests_path(markdown_path):
+    """摘要文件与 index.json 放在同一目录"""
+    return Path(markdown_path) / "digests.json"
+
+def save_digests(markdown_path, digests):
+    path = digests_path(markdown_path)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(digests, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(path)
+
+def load_digests(markdown_path):
+    """读取所有文章的摘要，按转换索引顺序，文件不存在时返回None"""
+    path = digests_path(markdown_path)
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
\ No newline at end of file
@@ -0,0 +1,194 @@
+import math
+from typing import Callable, Dict, List
+
+from text_digest import estimate_tokens
+
+# 每个阶段单次请求的输入token上限（本地估算值，留有余量）
+DEFAULT_MAX_INPUT_TOKENS = {
+    'classify': 60000,
+    'merge': 30000,
+    'name': 30000,
+    'extract': 30000,
+    'create': 60000,
+    'polish': 16000,
+}
+
+# dry-run估算耗时时，每个阶段单次请求的输出token数
+DEFAULT_OUTPUT_TOKENS = {
+    'classify': 3000,
+    'merge': 3000,
+    'name': 100,
+    'extract': 2000,
+    'create': 2000,
+    'polish': 2000,
+}
+
+STAGE_NAMES = {
+    'classify': '分批分类',
+    'merge': '合并主题',
+    'name': '主题命名',
+    'extract': '素材提取',
+    'create': '创作',
+    'polish': '语言优化',
+}
+
+class TokenBudget:
+    """提示词的token预算：本地估算token数，按预算截断或分组，并记录每个阶段的调用计划
+    
+    token数用 text_digest.estimate_tokens 估算，不调用模型接口。dry_run 为True时调用方只记录提示词不调用模型，
+    report() 汇总各阶段的调用次数、输入输出token和预计耗时。
+    """
+    
+    def __init__(self, max_input_tokens=None, output_tokens=None, seconds_per_call=3.0,
+                 output_tokens_per_second=60.0, dry_run=False):
+        self.max_input_tokens = dict(DEFAULT_MAX_INPUT_TOKENS, **(max_input_tokens or {}))
+        self.output_tokens = dict(DEFAULT_OUTPUT_TOKENS, **(output_tokens or {}))
+        self.seconds_per_call = seconds_per_call
+        self.output_tokens_per_second = output_tokens_per_second
+        self.dry_run = dry_run
+        # 阶段 -> {'calls', 'input_tokens', 'output_tokens', 'max_prompt', 'concurrency'}
+        self.stages = {}
+    
+    @classmethod
+    def from_config(cls, config, dry_run=False):
+        """从 token_budget 配置块创建"""
+        budget_config = config.get('token_budget', {}) or {}
+        return cls(
+            max_input_tokens=budget_config.get('max_input_tokens'),
+            output_tokens=budget_config.get('output_tokens'),
+            seconds_per_call=budget_config.get('seconds_per_call', 3.0),
+            output_tokens_per_second=budget_config.get('output_tokens_per_second', 60.0),
+            dry_run=dry_run,
+        )
+    
+    def limit(self, stage: str) -> int:
+        return self.max_input_tokens[stage]
+    
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+    
+    def prefix_length(self, text: str, max_tokens: int) -> int:
+        """二分查找不超过 max_tokens 的最长前缀的长度"""
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截断到不超过 max_tokens，尽量在换行处截断；未超出时原样返回"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        
+        low = self.prefix_length(text, max_tokens)
+        newline = text.rfind("\n", 0, low)
+        if newline > low * 0.8:
+            low = newline
+        return text[:low].rstrip()
+    
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """把文本切成每段不超过 max_tokens 的若干段，尽量在换行或句末处切分；各段按顺序拼接后与原文完全相同"""
+        pieces = []
+        while self.count(text) > max_tokens:
+            cut = max(1, self.prefix_length(text, max_tokens))
+            # 在后半段中找最后一个换行或句末标点
+            boundary = max(text.rfind(mark, 0, cut) for mark in ("\n", "。", "！", "？", "；", ". ", "! ", "? "))
+            if boundary >= cut // 2:
+                cut = boundary + 1
+            pieces.append(text[:cut])
+            text = text[cut:]
+        if text:
+            pieces.append(text)
+        return pieces
+    
+    def pack(self, items: List, max_tokens: int, cost: Callable, overhead: int = 0, max_items: int = None) -> List[List]:
+        """按顺序贪心地把条目分组，每组的 overhead + 条目token之和不超过 max_tokens
+        
+        单个条目本身超出预算时单独成组（由调用方决定是否截断）；max_items 同时限制每组的条目数。
+        """
+        groups = []
+        current, used = [], overhead
+        for item in items:
+            tokens = cost(item)
+            if current and (used + tokens > max_tokens or (max_items and len(current) >= max_items)):
+                groups.append(current)
+                current, used = [], overhead
+            current.append(item)
+            used += tokens
+        if current:
+            groups.append(current)
+        return groups
+    
+    def fit_sections(self, sections: Dict[str, str], max_tokens: int) -> Dict[str, str]:
+        """把多个段落一起压缩到 max_tokens 内：短的段落保留全文，剩余预算平均分给长的段落，各自截断末尾"""
+        costs = {name: self.count(text) for name, text in sections.items()}
+        if sum(costs.values()) <= max_tokens:
+            return dict(sections)
+        
+        remaining, pending = max_tokens, sorted(sections, key=lambda name: costs[name])
+        shares = {}
+        while pending:
+            share = remaining // len(pending)
+            name = pending[0]
+            if costs[name] > share:
+                break
+            shares[name] = costs[name]
+            remaining -= costs[name]
+            pending.pop(0)
+        for name in pending:
+            shares[name] = remaining // len(pending)
+        
+        return {name: sections[name] if shares[name] >= costs[name] else self.truncate(sections[name], shares[name])
+                for name in sections}
+    
+    def record(self, stage: str, prompt: str, concurrency: int = 1) -> int:
+        """记录一次（计划中的）模型调用，返回提示词的token数"""
+        tokens = self.count(prompt)
+        self.record_tokens(stage, tokens, concurrency)
+        return tokens
+    
+    def record_tokens(self, stage: str, tokens: int, concurrency: int = 1):
+        """记录一次已知输入token数的调用（提示词内容要等模型返回后才能确定时使用）"""
+        entry = self.stages.setdefault(stage, {
+            'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'max_prompt': 0, 'concurrency': 1,
+        })
+        entry['calls'] += 1
+        entry['input_tokens'] += tokens
+        entry['output_tokens'] += self.output_tokens[stage]
+        entry['max_prompt'] = max(entry['max_prompt'], tokens)
+        entry['concurrency'] = max(entry['concurrency'], concurrency)
+    
+    def seconds(self, stage: str) -> float:
+        """按并发数估算一个阶段的耗时：每轮请求的耗时为固定延迟加上输出时间"""
+        entry = self.stages[stage]
+        per_call = self.seconds_per_call + self.output_tokens[stage] / self.output_tokens_per_second
+        return math.ceil(entry['calls'] / entry['concurrency']) * per_call
+    
+    def report(self) -> str:
+        """汇总各阶段的调用计划"""
+        if not self.stages:
+            return "没有需要调用模型的请求"
+        
+        lines = []
+        total = {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'seconds': 0.0}
+        for stage, entry in self.stages.items():
+            seconds = self.seconds(stage)
+            over = "（超出预算）" if entry['max_prompt'] > self.limit(stage) else ""
+            lines.append(
+                f"{STAGE_NAMES.get(stage, stage)}: {entry['calls']} 次调用，输入约 {entry['input_tokens']:,} tokens"
+                f"（单次最多 {entry['max_prompt']:,}，上限 {self.limit(stage):,}）{over}，"
+                f"输出约 {entry['output_tokens']:,} tokens，预计 {seconds:.0f} 秒"
+            )
+            for key in ('calls', 'input_tokens', 'output_tokens'):
+                total[key] += entry[key]
+            total['seconds'] += seconds
+        lines.append(
+            f"合计: {total['calls']} 次调用，输入约 {total['input_tokens']:,} tokens，"
+            f"输出约 {total['output_tokens']:,} tokens，预计 {total['seconds']:.0f} 秒"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,349 @@
+import math
+import json
+import zlib
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from text_digest import plain_text, features
+
+class TextVectorizer:
+    """哈希特征的TF-IDF向量：英文单词和中文二元组经crc32映射到固定维度
+    
+    不需要保存词表，同一特征在不同运行中总是落在同一维，已保存的向量可以继续使用。
+    """
+    
+    def __init__(self, n_features=2 ** 16, max_chars=8000):
+        self.n_features = n_features
+        # 只取正文前面的部分，长文章不会拖慢向量化
+        self.max_chars = max_chars
+    
+    def counts(self, text):
+        """文本 -> {维度: 次数}"""
+        counts = {}
+        for feature, count in features(text[:self.max_chars]).items():
+            index = zlib.crc32(feature.encode('utf-8')) % self.n_features
+            counts[index] = counts.get(index, 0) + count
+        return counts
+    
+    def count_matrix(self, documents):
+        """多篇文章的特征次数矩阵（稀疏，每行一篇）"""
+        rows, cols, values = [], [], []
+        for row, counts in enumerate(documents):
+            rows.extend([row] * len(counts))
+            cols.extend(counts.keys())
+            values.extend(counts.values())
+        return sparse.csr_matrix(
+            (np.array(values, dtype=np.float32), (rows, cols)),
+            shape=(len(documents), self.n_features)
+        )
+    
+    @staticmethod
+    def document_frequency(matrix):
+        """每个维度出现在多少篇文章中"""
+        return np.bincount(matrix.indices, minlength=matrix.shape[1]).astype(np.float64)
+    
+    @staticmethod
+    def idf(document_frequency, documents):
+        return (np.log((1 + documents) / (1 + document_frequency)) + 1).astype(np.float32)
+    
+    @staticmethod
+    def transform(matrix, idf):
+        """次数矩阵 -> 对数词频 x IDF，并按行归一化"""
+        matrix = matrix.copy()
+        matrix.data = 1 + np.log(matrix.data)
+        matrix = matrix.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ matrix
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def spherical_kmeans(vectors, k, iterations=30, seed=0):
+    """按余弦相似度聚类（向量已归一化），返回 (每篇的簇编号, 簇中心, 每篇与所属中心的相似度)"""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    k = min(k, n)
+    
+    # k-means++ 初始化：离已选中心越远的文章越可能被选为新中心
+    chosen = [int(rng.integers(n))]
+    best = np.asarray(vectors @ vectors[chosen[0]].T.toarray()).ravel()
+    for _ in range(1, k):
+        distance = np.clip(1 - best, 0, None) ** 2
+        total = distance.sum()
+        index = int(rng.choice(n, p=distance / total)) if total > 0 else int(rng.integers(n))
+        chosen.append(index)
+        best = np.maximum(best, np.asarray(vectors @ vectors[index].T.toarray()).ravel())
+    centroids = normalize_rows(vectors[chosen].toarray())
+    
+    labels = None
+    for _ in range(iterations):
+        similarity = np.asarray(vectors @ centroids.T)
+        new_labels = similarity.argmax(axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        
+        membership = sparse.csr_matrix((np.ones(n, dtype=np.float32), (labels, np.arange(n))), shape=(k, n))
+        centroids = normalize_rows((membership @ vectors).toarray())
+        
+        # 空簇改用离自己中心最远的文章重新开始
+        sizes = np.bincount(labels, minlength=k)
+        for empty in np.flatnonzero(sizes == 0):
+            farthest = int(similarity[np.arange(n), labels].argmin())
+            centroids[empty] = vectors[farthest].toarray().ravel()
+            labels[farthest] = empty
+    
+    similarity = np.asarray(vectors @ centroids.T)
+    return labels, centroids, similarity[np.arange(n), labels]
+
+def choose_k(documents, articles_per_cluster=20, max_clusters=50):
+    """未指定簇数时按文章数估计"""
+    return max(1, min(max_clusters, math.ceil(documents / articles_per_cluster)))
+
+class ArticleClusterer:
+    """在本地对全部文章做向量聚类，每个簇只挑选几篇代表文章交给模型命名"""
+    
+    def __init__(self, markdown_path, num_clusters=None, articles_per_cluster=20, max_clusters=50,
+                 representatives=3, n_features=2 ** 16, max_chars=8000, seed=0):
+        self.markdown_path = Path(markdown_path)
+        self.num_clusters = num_clusters
+        self.articles_per_cluster = articles_per_cluster
+        self.max_clusters = max_clusters
+        self.representatives = representatives
+        self.seed = seed
+        self.vectorizer = TextVectorizer(n_features=n_features, max_chars=max_chars)
+    
+    @classmethod
+    def from_config(cls, config):
+        """从 cluster 配置创建"""
+        cluster_config = config.get('cluster', {}) or {}
+        return cls(
+            config['paths']['markdown'],
+            num_clusters=cluster_config.get('num_clusters'),
+            articles_per_cluster=cluster_config.get('articles_per_cluster', 20),
+            max_clusters=cluster_config.get('max_clusters', 50),
+            representatives=cluster_config.get('representatives', 3),
+            n_features=cluster_config.get('n_features', 2 ** 16),
+            max_chars=cluster_config.get('max_chars', 8000),
+            seed=cluster_config.get('seed', 0)
+        )
+    
+    def read_text(self, digest):
+        """文章正文（去掉Markdown标记），文件不存在时使用摘要中的开头摘录"""
+        path = Path(digest.get('markdown_path') or self.markdown_path / f"{digest['id']}.md")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read(self.vectorizer.max_chars * 2)
+        except OSError:
+            return f"{digest['title']}\n{digest.get('lead', '')}"
+        return f"{digest['title']}\n{plain_text(text)}"
+    
+    def vectorize(self, digests):
+        """返回 (次数矩阵, 归一化的TF-IDF矩阵)"""
+        matrix = self.vectorizer.count_matrix([self.vectorizer.counts(self.read_text(digest)) for digest in digests])
+        idf = self.vectorizer.idf(self.vectorizer.document_frequency(matrix), len(digests))
+        return matrix, self.vectorizer.transform(matrix, idf)
+    
+    def cluster(self, digests):
+        """聚类所有文章，返回簇列表（按文章数从多到少）：
+        [{'article_ids': [...], 'representatives': [...], 'centroid': 向量}, ...]
+        """
+        _, vectors = self.vectorize(digests)
+        k = self.num_clusters or choose_k(len(digests), self.articles_per_cluster, self.max_clusters)
+        labels, centroids, similarity = spherical_kmeans(vectors, k, seed=self.seed)
+        
+        clusters = []
+        for label in range(centroids.shape[0]):
+            members = np.flatnonzero(labels == label)
+            if not len(members):
+                continue
+            # 与中心最相似的文章作为代表
+            ranked = members[np.argsort(-similarity[members])]
+            clusters.append({
+                'article_ids': [digests[i]['id'] for i in members],
+                'representatives': [digests[i]['id'] for i in ranked[:self.representatives]],
+                'centroid': centroids[label],
+            })
+        clusters.sort(key=lambda cluster: -len(cluster['article_ids']))
+        return clusters
+
+class ThemeIndex:
+    """已有主题的向量索引，保存在 themes 目录，用于把新文章增量归入最接近的主题
+    
+    每个主题保存其文章向量之和（归一化后即为中心）和文章数，另外保存文档频率用于计算IDF。
+    未能归入任何主题的文章暂存为待定，积累到一定数量后才聚类并交给模型命名新主题。
+    """
+    
+    def __init__(self, themes_path, markdown_path, assign_threshold=0.2, min_new_theme=5,
+                 n_features=2 ** 16, max_chars=8000):
+        self.themes_path = Path(themes_path)
+        self.index_path = self.themes_path / "theme_index.json"
+        self.vectors_path = self.themes_path / "theme_vectors.npz"
+        # 与最近主题中心的余弦相似度低于该值时不归入已有主题
+        self.assign_threshold = assign_threshold
+        # 待定文章中至少这么多篇聚在一起时才建立新主题
+        self.min_new_theme = min_new_theme
+        self.clusterer = ArticleClusterer(markdown_path, n_features=n_features, max_chars=max_chars)
+        self.vectorizer = self.clusterer.vectorizer
+        
+        self.names = []
+        self.counts = []
+        self.sums = np.zeros((0, n_features), dtype=np.float32)
+        self.df = np.zeros(n_features, dtype=np.float64)
+        self.documents = 0
+        self.assigned = {}
+        self.pending = []
+    
+    @classmethod
+    def from_config(cls, config):
+        """从 incremental 和 cluster 配置创建"""
+        incremental_config = config.get('incremental', {}) or {}
+        cluster_config = config.get('cluster', {}) or {}
+        return cls(
+            config['paths']['themes'],
+            config['paths']['markdown'],
+            assign_threshold=incremental_config.get('assign_threshold', 0.2),
+            min_new_theme=incremental_config.get('min_new_theme_articles', 5),
+            n_features=cluster_config.get('n_features', 2 ** 16),
+            max_chars=cluster_config.get('max_chars', 8000)
+        )
+    
+    def exists(self):
+        return self.index_path.exists() and self.vectors_path.exists()
+    
+    def load(self):
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        with np.load(self.vectors_path) as vectors:
+            self.sums = vectors['sums']
+            self.df = vectors['df']
+        if self.sums.shape[1] != self.vectorizer.n_features:
+            raise ValueError("主题索引的向量维度与配置不一致，请重新运行完整分类")
+        self.names = index['names']
+        self.counts = index['counts']
+        self.documents = index['documents']
+        self.assigned = index['assigned']
+        self.pending = index['pending']
+    
+    def save(self):
+        self.themes_path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.vectors_path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, sums=self.sums, df=self.df)
+        tmp_path.replace(self.vectors_path)
+        
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'names': self.names,
+                'counts': self.counts,
+                'documents': self.documents,
+                'assigned': self.assigned,
+                'pending': self.pending,
+            }, f, ensure_ascii=False)
+        tmp_path.replace(self.index_path)
+    
+    def build(self, themes, digests):
+        """根据完整分类的结果重建索引，themes 中每个主题需带 article_ids"""
+        matrix, vectors = self.clusterer.vectorize(digests)
+        self.df = self.vectorizer.document_frequency(matrix)
+        self.documents = len(digests)
+        
+        rows = {digest['id']: row for row, digest in enumerate(digests)}
+        self.names, self.counts, sums = [], [], []
+        self.assigned = {}
+        for theme in themes:
+            members = [rows[article_id] for article_id in theme['article_ids'] if article_id in rows]
+            if not members:
+                continue
+            self.names.append(theme['theme_name'])
+            self.counts.append(len(members))
+            sums.append(np.asarray(vectors[members].sum(axis=0)).ravel())
+            for article_id in theme['article_ids']:
+                self.assigned.setdefault(article_id, theme['theme_name'])
+        self.sums = np.array(sums, dtype=np.float32).reshape(len(sums), self.vectorizer.n_features)
+        self.pending = [digest['id'] for digest in digests if digest['id'] not in self.assigned]
+    
+    def vectorize(self, digests, update_df=False):
+        """用已保存的文档频率计算新文章的向量，update_df 时先把这些文章计入文档频率"""
+        matrix = self.vectorizer.count_matrix([
+            self.vectorizer.counts(self.clusterer.read_text(digest)) for digest in digests
+        ])
+        if update_df:
+            self.df += self.vectorizer.document_frequency(matrix)
+            self.documents += len(digests)
+        return self.vectorizer.transform(matrix, self.vectorizer.idf(self.df, self.documents))
+    
+    def assign(self, digests, new=True):
+        """把文章归入最相似的已有主题，返回 ({主题名: [文章ID]}, [未归类的文章ID])
+        
+        new 为False时表示重新尝试归类待定文章，这些文章已计入文档频率
+        """
+        assignments = {}
+        unassigned = []
+        if not digests:
+            return assignments, unassigned
+        
+        vectors = self.vectorize(digests, update_df=new)
+        if self.names:
+            similarity = np.asarray(vectors @ normalize_rows(self.sums).T)
+        else:
+            similarity = np.zeros((len(digests), 0))
+        
+        for row, digest in enumerate(digests):
+            best = int(similarity[row].argmax()) if similarity.shape[1] else -1
+            if best < 0 or similarity[row, best] < self.assign_threshold:
+                unassigned.append(digest['id'])
+                continue
+            # 中心随新文章更新
+            self.sums[best] += vectors[row].toarray().ravel()
+            self.counts[best] += 1
+            self.assigned[digest['id']] = self.names[best]
+            assignments.setdefault(self.names[best], []).append(digest['id'])
+        
+        pending = set(self.pending)
+        self.pending = [article_id for article_id in self.pending if article_id not in self.assigned]
+        self.pending.extend(article_id for article_id in unassigned if article_id not in pending)
+        return assignments, unassigned
+    
+    def pending_clusters(self, digests):
+        """对待定文章聚类，返回文章数达到 min_new_theme 的簇，含 vector_sum 供 add_theme 使用"""
+        if len(digests) < self.min_new_theme:
+            return []
+        vectors = self.vectorize(digests)
+        k = max(1, len(digests) // self.min_new_theme)
+        labels, _, similarity = spherical_kmeans(vectors, k)
+        
+        clusters = []
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            if len(members) < self.min_new_theme:
+                continue
+            ranked = members[np.argsort(-similarity[members])]
+            clusters.append({
+                'article_ids': [digests[i]['id'] for i in members],
+                'representatives': [digests[i]['id'] for i in ranked[:self.clusterer.representatives]],
+                'vector_sum': np.asarray(vectors[members].sum(axis=0)).ravel(),
+            })
+        return clusters
+    
+    def add_theme(self, theme_name, cluster):
+        """把命名后的待定簇加入索引，名称与已有主题相同时并入该主题"""
+        if theme_name in self.names:
+            position = self.names.index(theme_name)
+            self.sums[position] += cluster['vector_sum']
+            self.counts[position] += len(cluster['article_ids'])
+        else:
+            self.names.append(theme_name)
+            self.counts.append(len(cluster['article_ids']))
+            self.sums = np.vstack([self.sums, cluster['vector_sum'][None, :].astype(np.float32)])
+        
+        for article_id in cluster['article_ids']:
+            self.assigned[article_id] = theme_name
+        members = set(cluster['article_ids'])
+        self.pending = [article_id for article_id in self.pending if article_id not in members]
@@ -2,7 +2,14 @@
 """测试爬虫功能"""
 
 import asyncio
-from src.crawler import WechatCrawler
+import sys
+from pathlib import Path
+
+# 与main.py一致，把src目录加入Python路径
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from crawler import WechatCrawler
+from fetcher import AsyncFetcher
 
 async def test_single_url():
     """测试单个URL爬取"""
@@ -16,7 +23,8 @@ async def test_single_url():
     
     # 直接测试extract_content
     print("\n1. 测试内容提取...")
-    content = crawler.extract_content(test_url)
+    async with AsyncFetcher(crawler.config, crawler.headers) as fetcher:
+        content = await crawler.extract_content(fetcher, test_url)
     
     if content:
         print(f"✅ 提取成功")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""近似重复检测的测试：分段数必须大于汉明距离阈值，阈值内的重复文章不能漏检
+
+用法: python test_dedup.py  或  python -m pytest test_dedup.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from dedup import Deduplicator, min_bands
+
+BASE = 0x0123456789abcdef
+
+def digest(article_id, simhash, chars=1000):
+    return {'id': article_id, 'title': article_id, 'simhash': f"{simhash:016x}", 'chars': chars}
+
+def spread_bits(count):
+    """在64位指纹中均匀分布的 count 个比特，4段分法下每段都有不同"""
+    mask = 0
+    for i in range(count):
+        mask |= 1 << (i * 64 // count)
+    return mask
+
+def test_bands_must_exceed_max_distance():
+    for max_distance, bands in [(5, 4), (4, 4), (8, 8)]:
+        try:
+            Deduplicator("data/markdown", max_distance=max_distance, bands=bands)
+        except ValueError:
+            continue
+        raise AssertionError(f"max_distance={max_distance}, bands={bands} 应当报错")
+
+def test_bands_default_to_smallest_safe_divisor():
+    assert [min_bands(d) for d in (0, 1, 3, 4, 5, 7, 8, 31, 63)] == [1, 2, 4, 8, 8, 8, 16, 32, 64]
+    assert Deduplicator("data/markdown", max_distance=5).bands == 8
+
+def test_distance_five_not_missed():
+    # 5个不同的比特分布在4段中的每一段，4段分法找不到候选，自动选择的8段必须找到
+    digests = [digest("a", BASE), digest("b", BASE ^ spread_bits(5), chars=900), digest("c", ~BASE & (2 ** 64 - 1))]
+    groups = Deduplicator("data/markdown", max_distance=5).find_groups(digests)
+    assert groups == [(0, [(1, 5)])], groups
+
+def test_config_bands_too_small_for_cli_override():
+    config = {'paths': {'markdown': "data/markdown"}, 'dedup': {'max_distance': 5, 'bands': 4}}
+    try:
+        Deduplicator.from_config(config)
+    except ValueError:
+        return
+    raise AssertionError("配置的 bands 不大于 max_distance 时应当报错")
+
+if __name__ == "__main__":
+    failed = 0
+    for test in [test_bands_must_exceed_max_distance, test_bands_default_to_smallest_safe_divisor,
+                 test_distance_five_not_missed, test_config_bands_too_small_for_cli_override]:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""微信Markdown渲染器的golden测试：固定输入的输出必须与预期完全一致，
+正文文字必须与markdownify的结果一致（不丢字、不多字）
+
+用法: python test_markdown_renderer.py  或  python -m pytest test_markdown_renderer.py
+"""
+
+import re
+import sys
+from pathlib import Path
+
+from lxml import html as lxml_html
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from converter import WechatMarkdownRenderer, HtmlToMarkdownConverter
+
+# (名称, 输入HTML, 预期Markdown)
+GOLDEN_CASES = [
+    (
+        "嵌套section和样式span",
+        '<div id="js_content"><section style="margin: 0 8px;"><section><p style="line-height: 1.75;">'
+        '<span style="color: #333;">  第一段 </span><span style="font-weight: bold;">重点</span>'
+        '<span>继续</span></p></section></section></div>',
+        "第一段 **重点**继续\n",
+    ),
+    (
+        "空段落和nbsp",
+        '<div><p><br></p><p>&nbsp;</p><p>正文&nbsp;&nbsp;内容</p><p><span><br></span></p></div>',
+        "正文 内容\n",
+    ),
+    (
+        "data-src图片和本地图片",
+        '<div><p><img data-src="https://mmbiz.qpic.cn/a/640?wx_fmt=png" class="rich_pages"></p>'
+        '<p><img src="../images/a/image_2.png" data-src="https://mmbiz.qpic.cn/b/640" alt="图片"></p>'
+        '<p><img src="data:image/svg+xml,abc" data-src="https://mmbiz.qpic.cn/c/640"></p></div>',
+        "![](https://mmbiz.qpic.cn/a/640?wx_fmt=png)\n\n"
+        "![图片](../images/a/image_2.png)\n\n"
+        "![](https://mmbiz.qpic.cn/c/640)\n",
+    ),
+    (
+        "标题和强调",
+        '<div><h2><span style="font-size: 18px;">一、小标题</span></h2>'
+        '<p>普通<strong> 粗体 </strong><em>斜体</em><span style="font-weight:700"><strong>双重</strong></span></p></div>',
+        "## 一、小标题\n\n普通 **粗体** *斜体***双重**\n",
+    ),
+    (
+        "行内元素包含块元素",
+        '<div><span><p>第一段</p><p>第二段</p></span><strong><section>加粗区块</section></strong></div>',
+        "第一段\n\n第二段\n\n加粗区块\n",
+    ),
+    (
+        "换行",
+        '<div><p>第一行<br>第二行<br/><br>第三行<br></p></div>',
+        "第一行  \n第二行  \n  \n第三行\n",
+    ),
+    (
+        "列表",
+        '<div><ul><li>一</li><li><section><p>二</p></section><ul><li>二点一</li></ul></li></ul>'
+        '<ol><li>甲</li><li>乙</li></ol></div>',
+        "- 一\n- 二\n  - 二点一\n\n1. 甲\n2. 乙\n",
+    ),
+    (
+        "引用",
+        '<div><blockquote><p>引用一</p><p>引用二</p></blockquote></div>',
+        "> 引用一\n>\n> 引用二\n",
+    ),
+    (
+        "链接和转义",
+        '<div><p>见<a href="https://example.com/a_b">这里</a>，a*b_c，'
+        '<a href="javascript:;">无效链接</a></p></div>',
+        "见[这里](https://example.com/a_b)，a\\*b\\_c，无效链接\n",
+    ),
+    (
+        "代码块",
+        '<div><pre class="code-snippet__js"><code><span>let a = 1;</span></code>'
+        '<code><span>  a++;</span></code></pre><p>行内<code>x = 1</code></p></div>',
+        "```js\nlet a = 1;\n  a++;\n```\n\n行内`x = 1`\n",
+    ),
+    (
+        "表格",
+        '<div><table><tbody><tr><th>名称</th><th>值</th></tr>'
+        '<tr><td><p>a</p></td><td>1|2</td></tr></tbody></table></div>',
+        "| 名称 | 值 |\n| --- | --- |\n| a | 1\\|2 |\n",
+    ),
+    (
+        "隐藏元素和脚本",
+        '<div><p style="display: none;">隐藏</p><p>可见</p><mpvoice name="x"></mpvoice>'
+        '<iframe data-src="https://v.qq.com/x"></iframe></div>',
+        "可见\n",
+    ),
+]
+
+def render(html_text):
+    return WechatMarkdownRenderer().render(lxml_html.fragment_fromstring(html_text))
+
+def plain_text(markdown):
+    """去掉Markdown标记和空白，只保留文字，用于与markdownify比较"""
+    markdown = re.sub(r'!\[[^\]]*\]\([^)]*\)', '', markdown)
+    markdown = re.sub(r'\]\([^)]*\)', '', markdown)
+    markdown = re.sub(r'```\w*', '', markdown)
+    markdown = markdown.replace('\\', '')
+    markdown = re.sub(r'^\s*(#+|>|-|\d+\.)\s', '', markdown, flags=re.M)
+    return re.sub(r'[\s*_`\[\]|>-]', '', markdown)
+
+def test_golden_outputs():
+    for name, html_text, expected in GOLDEN_CASES:
+        output = render(html_text)
+        assert output == expected, f"{name}:\n期望:\n{expected!r}\n实际:\n{output!r}"
+
+def test_no_blank_line_runs():
+    for name, html_text, _ in GOLDEN_CASES:
+        assert '\n\n\n' not in render(html_text), name
+
+def test_same_text_as_markdownify():
+    converter = HtmlToMarkdownConverter.__new__(HtmlToMarkdownConverter)
+    for name, html_text, _ in GOLDEN_CASES:
+        if name == "隐藏元素和脚本":
+            # markdownify不识别display:none
+            continue
+        expected = plain_text(converter.markdownify(html_text))
+        assert plain_text(render(html_text)) == expected, name
+
+if __name__ == "__main__":
+    failed = 0
+    for test in [test_golden_outputs, test_no_blank_line_runs, test_same_text_as_markdownify]:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
\ No newline at end of file
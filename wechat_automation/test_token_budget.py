@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""token预算的测试：超出上限的长段落要切成几段交给模型，不能丢字
+
+用法: python test_token_budget.py  或  python -m pytest test_token_budget.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from token_budget import TokenBudget
+
+# 没有空行的长文章：一整段，约6000个token
+LONG_PARAGRAPH = "".join(f"第{i}句话讲的是如何把文章写得更清楚，AI writing 工具也能帮忙。" for i in range(200))
+
+POLISH_TEMPLATE = "请优化下面的文章：\n{article_content}"
+
+def test_split_keeps_every_character():
+    budget = TokenBudget()
+    for text in [LONG_PARAGRAPH, "字" * 5000, "word " * 3000]:
+        pieces = budget.split(text, 500)
+        assert "".join(pieces) == text
+        assert len(pieces) > 1
+        assert all(budget.count(piece) <= 500 for piece in pieces)
+
+def test_split_prefers_sentence_end():
+    pieces = TokenBudget().split(LONG_PARAGRAPH, 500)
+    assert all(piece.endswith("。") for piece in pieces[:-1])
+
+def make_creator(limit):
+    """不读取配置、不连接模型的创作助手，模型原样返回待优化的文章"""
+    try:
+        from creator import ContentCreator
+    except ImportError:
+        return None
+    
+    class EchoModel:
+        def generate_content(self, prompt):
+            return type("Response", (), {"text": prompt[len(POLISH_TEMPLATE.format(article_content="")):]})()
+    
+    creator = ContentCreator.__new__(ContentCreator)
+    creator.polish_prompt_template = POLISH_TEMPLATE
+    creator.budget = TokenBudget(max_input_tokens={'polish': limit})
+    creator.model = EchoModel()
+    return creator
+
+def test_polish_long_paragraph_sends_everything():
+    creator = make_creator(800)
+    if creator is None:
+        print("未安装google-generativeai，跳过")
+        return
+    
+    article = "# 标题\n\n开头一段。\n\n" + LONG_PARAGRAPH + "\n\n结尾一段。"
+    sections = creator.polish_sections(article)
+    assert len(sections) > 2
+    assert "".join(separator + text for separator, text in sections) == article
+    for _, text in sections:
+        assert creator.budget.count(POLISH_TEMPLATE.format(article_content=text)) <= 800
+    
+    # 切开优化后重新拼接，原文每个字都在
+    assert creator.polish_article(article) == article
+
+if __name__ == "__main__":
+    failed = 0
+    for test in [test_split_keeps_every_character, test_split_prefers_sentence_end,
+                 test_polish_long_paragraph_sends_everything]:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)